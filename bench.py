@@ -0,0 +1,228 @@
+import argparse
+import json
+import subprocess
+import sys
+from random import Random
+from statistics import median
+from time import perf_counter_ns, strftime
+from game import Grid
+from matrix_expansion import expandMatrix, findSurroundings, \
+    countNeighborhoods
+
+"""
+Benchmarks of the engine's hot paths on several board sizes and mine
+densities, up to 1000x1000. They only use the engine modules, so they
+run without a display.
+Every run is appended to a JSON lines file with the git commit it ran
+on, so the results of two commits can be compared.
+Usage examples:
+    python bench.py
+    python bench.py --quick --compare HEAD~1
+"""
+
+SIZES = [(9, 9), (16, 30), (100, 100), (300, 300), (1000, 1000)]
+DENSITIES = [0.05, 0.12, 0.2]
+N_CALLS = 10000 #calls per sample of the cheap operations
+
+## every benchmark gets (height, width, n_mines, rng) and returns
+## (function to time, number of operations it does); what it does
+## before returning is setup and is not timed
+
+def benchConstruction(height, width, n_mines, rng):
+    return (lambda: Grid(height, width, n_mines)), 1
+
+
+def benchSetMines(height, width, n_mines, rng):
+    grid = Grid(height, width, n_mines)
+    seed = rng.random()
+    return (lambda: grid.setMines(height // 2, width // 2, seed)), 1
+
+
+def _minedGrid(height, width, n_mines, rng):
+    grid = Grid(height, width, n_mines)
+    grid.setMines(height // 2, width // 2, rng.random())
+    return grid
+
+
+def _positions(height, width, rng):
+    return [(rng.randrange(height), rng.randrange(width))
+            for k in range(N_CALLS)]
+
+
+def benchCountMines(height, width, n_mines, rng):
+    grid = _minedGrid(height, width, n_mines, rng)
+    positions = _positions(height, width, rng)
+    def run():
+        for row, col in positions:
+            grid.countMines(row, col)
+    return run, N_CALLS
+
+
+def benchExpandPosition(height, width, n_mines, rng):
+    """
+    Expands from the first click, which always opens an area.
+    """
+    grid = _minedGrid(height, width, n_mines, rng)
+    return (lambda: grid.expandPosition(height // 2, width // 2)), 1
+
+
+def benchVictory(height, width, n_mines, rng):
+    grid = _minedGrid(height, width, n_mines, rng)
+    grid.expandPosition(height // 2, width // 2)
+    def run():
+        for k in range(N_CALLS):
+            grid.hadVictory()
+    return run, N_CALLS
+
+
+def benchExpandMatrix(height, width, n_mines, rng):
+    mat = [[0]*width for r in range(height)]
+    return (lambda: expandMatrix(mat)), 1
+
+
+def benchFindSurroundings(height, width, n_mines, rng):
+    mat = [[0]*width for r in range(height)]
+    positions = _positions(height, width, rng)
+    def run():
+        for p in positions:
+            findSurroundings(mat, p)
+    return run, N_CALLS
+
+
+def benchCountNeighborhoods(height, width, n_mines, rng):
+    """
+    Counts the mines up to 3 squares away from every square.
+    """
+    grid = _minedGrid(height, width, n_mines, rng)
+    mines = bytes(grid.getMines())
+    return (lambda: countNeighborhoods(mines, height, width, 3)), 1
+
+
+#name: (benchmark, depends on the density)
+BENCHMARKS = {"construction": (benchConstruction, False),
+              "setMines": (benchSetMines, True),
+              "countMines": (benchCountMines, False),
+              "expandPosition": (benchExpandPosition, True),
+              "victory": (benchVictory, False),
+              "expandMatrix": (benchExpandMatrix, False),
+              "findSurroundings": (benchFindSurroundings, False),
+              "countNeighborhoods": (benchCountNeighborhoods, False)}
+
+def runBenchmark(bench, height, width, n_mines, repeat, seed):
+    """
+    Times repeat samples of a benchmark, each one with its own setup.
+    Returns the minimum and the median nanoseconds per operation.
+    """
+    rng = Random(seed)
+    samples = []
+    for k in range(repeat):
+        run, n_ops = bench(height, width, n_mines, rng)
+        start = perf_counter_ns()
+        run()
+        samples.append((perf_counter_ns() - start) / n_ops)
+    return min(samples), median(samples)
+
+
+def gitCommit():
+    """
+    Returns the short hash of HEAD, with "+" if the tracked files have
+    changes, or "unknown" outside a git repository.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True,
+                                check=True).stdout.strip()
+        changes = subprocess.run(["git", "status", "--porcelain",
+                                  "--untracked-files=no"],
+                                 capture_output=True, text=True,
+                                 check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + "+" if changes else commit
+
+
+def resolveCommit(rev):
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", rev],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return rev
+
+
+def loadRuns(path):
+    try:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def compare(run, other, out):
+    """
+    Writes the ratio between the medians of two runs (> 1 is slower).
+    """
+    out.write("\ncompared with {} ({}):\n".format(other["commit"],
+                                                  other["date"]))
+    for key, result in run["results"].items():
+        if key in other["results"]:
+            ratio = result["median_ns"] / other["results"][key]["median_ns"]
+            flag = "  <- slower" if ratio > 1.1 else ""
+            out.write("{:<42} {:>7.2f}x{}\n".format(key, ratio, flag))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the engine's hot paths and keeps the "
+                    "results of every commit.")
+    parser.add_argument("--bench", action="append", choices=list(BENCHMARKS),
+                        help="benchmark to run, may be repeated "
+                             "(default: all)")
+    parser.add_argument("--quick", action="store_true",
+                        help="only boards up to 100x100")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="samples of each benchmark")
+    parser.add_argument("--seed", default="0")
+    parser.add_argument("--results", default="bench_results.jsonl",
+                        help="file where the runs are kept")
+    parser.add_argument("--compare", metavar="REV",
+                        help="compares with the last run of this commit")
+    args = parser.parse_args(argv)
+
+    sizes = [s for s in SIZES if not args.quick or s[0]*s[1] <= 10000]
+    names = args.bench or list(BENCHMARKS)
+    out = sys.stdout
+
+    run = {"commit": gitCommit(), "date": strftime("%Y-%m-%d %H:%M:%S"),
+           "python": sys.version.split()[0], "repeat": args.repeat,
+           "results": {}}
+    out.write("{:<42} {:>12} {:>12}\n".format("benchmark", "min ns/op",
+                                              "median ns/op"))
+    for name in names:
+        bench, by_density = BENCHMARKS[name]
+        for height, width in sizes:
+            for density in DENSITIES if by_density else DENSITIES[1:2]:
+                n_mines = int(height*width*density)
+                key = "{} {}x{}x{}".format(name, height, width, n_mines)
+                best, middle = runBenchmark(bench, height, width, n_mines,
+                                            args.repeat, args.seed)
+                run["results"][key] = {"min_ns": best, "median_ns": middle}
+                out.write("{:<42} {:>12.0f} {:>12.0f}\n".format(key, best,
+                                                                middle))
+                out.flush()
+
+    if args.compare:
+        commit = resolveCommit(args.compare)
+        others = [r for r in loadRuns(args.results)
+                  if r["commit"].rstrip("+") == commit]
+        if others:
+            compare(run, others[-1], out)
+        else:
+            out.write("\nno runs of {} in {}\n".format(commit, args.results))
+
+    with open(args.results, "a") as f:
+        f.write(json.dumps(run) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import mmap
+import struct
+
+"""
+Module that saves and loads grids and their moves in a compact binary
+file (.msw), read through a memory map so that big collections of files
+can be scanned or replayed without loading them into Python objects.
+
+File layout (little-endian):
+    header (32 bytes): magic "MSWP", version, flags (bit 0: has seed),
+        2 bytes of padding, height, width, number of mines (4 bytes
+        each), seed (8 bytes, signed) and number of moves (4 bytes)
+    mines: one bit per square, row by row, ceil(height*width/8) bytes
+    moves: two unsigned varints per move:
+        (zigzag(index - previous index) << 2) | kind
+        milliseconds since the previous move
+    where index = row*width + col and kind is 0 (reveal), 1 (flag) or
+    2 (chord).
+"""
+
+MAGIC = b"MSWP"
+VERSION = 1
+HEADER = struct.Struct("<4sBBxxIIIqI")
+HAS_SEED = 1
+
+KINDS = ("reveal", "flag", "chord")
+
+#bytes 0/1 <-> characters "0"/"1", to pack bits through int()
+_TO_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+_FROM_DIGITS = bytes.maketrans(b"01", b"\x00\x01")
+
+def packBits(plane):
+    """
+    Packs a plane of 0/1 bytes in bits, the first byte in the lowest bit.
+    """
+    if not plane:
+        return b""
+    bits = int(bytes(plane).translate(_TO_DIGITS)[::-1], 2)
+    return bits.to_bytes((len(plane) + 7) // 8, "little")
+
+
+def unpackBits(data, n):
+    """
+    Unpacks the first n bits of data in a plane of 0/1 bytes.
+    """
+    bits = int.from_bytes(data[:(n + 7) // 8], "little")
+    digits = format(bits, "0{}b".format(n))[-n:] if n else ""
+    return digits[::-1].encode().translate(_FROM_DIGITS)
+
+
+def _writeVarint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _readVarint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("truncated move log")
+        b = data[pos]
+        pos += 1
+        value |= (b & 0x7f) << shift
+        if b < 0x80:
+            return value, pos
+        shift += 7
+
+
+def writeBoard(path, height, width, n_mines, mines, seed=None, moves=()):
+    """
+    Writes a board file. mines is the mines plane (one 0/1 byte per
+    square) and moves a list of (kind, row, col, milliseconds since the
+    game started).
+    """
+    out = bytearray(HEADER.pack(MAGIC, VERSION,
+                                HAS_SEED if seed is not None else 0,
+                                height, width, n_mines,
+                                seed if seed is not None else 0,
+                                len(moves)))
+    out += packBits(mines)
+
+    last_index = 0
+    last_time = 0
+    for kind, row, col, time in moves:
+        index = row*width + col
+        delta = index - last_index
+        zigzag = delta*2 if delta >= 0 else -delta*2 - 1
+        _writeVarint(out, zigzag << 2 | KINDS.index(kind))
+        _writeVarint(out, max(0, time - last_time))
+        last_index = index
+        last_time = time
+
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+class BoardFile:
+    """
+    Read-only view of a board file through a memory map. Only the header
+    is decoded when opening; the mines and moves are read from the map
+    when asked for, so scanning many files stays cheap.
+    Can be used as a context manager.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = None
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            magic, version, flags, self.height, self.width, self.n_mines, \
+                seed, self.n_moves = HEADER.unpack_from(self._map, 0)
+        except (ValueError, struct.error):
+            self.close()
+            raise ValueError("{} is not a board file".format(path))
+
+        self.seed = seed if flags & HAS_SEED else None
+        self._mines_start = HEADER.size
+        self._moves_start = self._mines_start \
+                            + (self.height*self.width + 7) // 8
+        if magic != MAGIC or version != VERSION \
+           or self.height < 1 or self.width < 1 \
+           or self.n_mines > self.height*self.width \
+           or len(self._map) < self._moves_start:
+            self.close()
+            raise ValueError("{} is not a board file".format(path))
+
+    def isMine(self, row, col):
+        i = row*self.width + col
+        return self._map[self._mines_start + i // 8] >> (i % 8) & 1 == 1
+
+    def getMines(self):
+        """
+        Returns the mines plane (one 0/1 byte per square, row by row).
+        Raises ValueError if it does not hold n_mines mines.
+        """
+        mines = unpackBits(self._map[self._mines_start:self._moves_start],
+                           self.height*self.width)
+        if mines.count(1) != self.n_mines:
+            raise ValueError("the mines do not match the header")
+        return mines
+
+    def iterMoves(self):
+        """
+        Yields the moves as (kind, row, col, milliseconds since the game
+        started), decoding them straight from the map.
+        Raises ValueError if the move log is truncated or corrupt.
+        """
+        data = self._map
+        pos = self._moves_start
+        index = 0
+        time = 0
+        for n in range(self.n_moves):
+            value, pos = _readVarint(data, pos)
+            delta, pos = _readVarint(data, pos)
+            zigzag = value >> 2
+            index += zigzag // 2 if zigzag % 2 == 0 else -(zigzag + 1) // 2
+            time += delta
+            if value & 3 >= len(KINDS) \
+               or not 0 <= index < self.height*self.width:
+                raise ValueError("corrupt move log")
+            yield (KINDS[value & 3],) + divmod(index, self.width) + (time,)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
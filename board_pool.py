@@ -0,0 +1,336 @@
+import threading
+from collections import OrderedDict, deque
+from random import Random
+from game import Grid
+from generator import generateNoGuess
+from solver import solveFrom
+from matrix_expansion import neighborTable
+
+"""
+Module that keeps grids generated ahead of time, so that the first click
+of a game does not wait for the mines to be placed.
+"""
+
+class Order:
+    """
+    Grid asked for a first click, which the pool's background thread may
+    still be generating. Once done() is True, mines and stats are set
+    (as returned by BoardPool.take), and fallback tells if a no-guess
+    grid was asked for but a plain one was made instead.
+    """
+
+    def __init__(self, config, row, col):
+        self.config = config
+        self.row = row
+        self.col = col
+        self.mines = None
+        self.stats = None
+        self.fallback = False
+        self._done = threading.Event()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def finish(self, mines, stats, fallback=False):
+        self.mines = mines
+        self.stats = stats
+        self.fallback = fallback
+        self._done.set()
+
+
+def plainMines(height, width, n_mines, row, col):
+    """
+    Returns the mines of a plain grid for a first click at (row, col).
+    """
+    grid = Grid(height, width, n_mines)
+    grid.setMines(row, col)
+    return [i for i, m in enumerate(grid.getMines()) if m]
+
+
+class BoardPool:
+    """
+    Class that pre-generates grids in a background thread for the most
+    recent configurations (height, width, number of mines, no-guess).
+    The configurations are kept in LRU order: asking for a new one when
+    there are max_configs already evicts the least recently used, and so
+    does generating a grid for the most recent one when the grids stored
+    would have more than max_cells squares in total.
+    Counts hits (first clicks answered from the pool), misses (grids
+    generated for the click) and evictions.
+
+    A grid must fit the first click: no mines in the clicked square and
+    its surroundings (and, for no-guess grids, solvable from it).
+    - Plain grids are stored with their mines anywhere; the mines that
+      fall in the clicked zone are moved to random free squares outside
+      it, which gives the same odds as placing them after the click.
+      So plain grids are always hits.
+    - No-guess grids are generated from a random first click. A first
+      click always opens a square with no mines around, and every such
+      square of a connected area opens the same way, so the pool plays
+      the grid once from each of its largest areas (up to max_areas)
+      and keeps the squares of the areas it wins from. The grid,
+      flipped vertically and/or horizontally, is a hit if the clicked
+      square is one of them.
+      On a miss, a second background thread generates a grid for the
+      click (see order), so the GUI does not wait for it; meanwhile the
+      first one pauses between the steps of its own grid.
+    """
+
+    def __init__(self, per_config=3, max_configs=4, max_cells=4000000,
+                 max_areas=16, rng=None):
+        self.per_config = per_config
+        self.max_areas = max_areas
+        self.max_configs = max_configs
+        self.max_cells = max_cells
+        self._rng = rng if isinstance(rng, Random) else Random(rng)
+
+        self._condition = threading.Condition()
+        #config: deque of (mines, good starts or None, generation stats)
+        self._pools = OrderedDict()
+        self._failed = set() #no-guess configs the generator can't do
+        self._orders = deque() #no-guess misses, the first one being made
+        self._cells = 0 #squares of the grids stored
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+        self._order_thread = threading.Thread(target=self._takeOrders,
+                                              daemon=True)
+        self._order_thread.start()
+
+    def getStats(self):
+        with self._condition:
+            return {"hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "configs": len(self._pools),
+                    "grids": sum(len(p) for p in self._pools.values()),
+                    "cells": self._cells}
+
+    def prefetch(self, height, width, n_mines, no_guess=False):
+        """
+        Marks a configuration as the most recent one, so the background
+        thread fills its pool.
+        """
+        config = (height, width, n_mines, no_guess)
+        with self._condition:
+            if config in self._pools:
+                self._pools.move_to_end(config)
+            else:
+                self._pools[config] = deque()
+                while len(self._pools) > self.max_configs:
+                    self._evict()
+            self._condition.notify_all()
+
+    def _evict(self):
+        config, pool = self._pools.popitem(last=False)
+        self._cells -= len(pool) * config[0] * config[1]
+        self.evictions += 1
+
+    def take(self, height, width, n_mines, row, col, no_guess=False):
+        """
+        Returns the mines (indexes row*width + col) of a grid fitting a
+        first click at (row, col), and the no-guess generation's
+        statistics (None for plain grids). Waits for the grid on a miss.
+        """
+        order = self.order(height, width, n_mines, row, col, no_guess)
+        order.wait()
+        return order.mines, order.stats
+
+    def order(self, height, width, n_mines, row, col, no_guess=False):
+        """
+        Returns an Order for a grid fitting a first click at (row, col).
+        It is done at once on a hit, for plain grids and for no-guess
+        configurations the generator can't do (a plain grid, as a
+        fallback); otherwise a background thread generates the grid.
+        """
+        config = (height, width, n_mines, no_guess)
+        order = Order(config, row, col)
+        entry = None
+        with self._condition:
+            pool = self._pools.get(config)
+            if pool is not None:
+                self._pools.move_to_end(config)
+                for k, (mines, starts, stats) in enumerate(pool):
+                    mines = self._fit(config, mines, starts, row, col)
+                    if mines is not None:
+                        entry = (mines, stats)
+                        del pool[k]
+                        self._cells -= height*width
+                        break
+            if entry is None:
+                self.misses += 1
+                if no_guess and config not in self._failed:
+                    self._orders.append(order)
+                    self._condition.notify_all()
+                    return order
+            else:
+                self.hits += 1
+            self._condition.notify_all()
+
+        if entry is not None:
+            order.finish(*entry)
+        else:
+            order.finish(plainMines(height, width, n_mines, row, col), None,
+                         fallback=no_guess)
+        return order
+
+    def _fill(self, order):
+        """
+        Generates the grid of an order (runs in the order thread).
+        """
+        height, width, n_mines, no_guess = order.config
+        try:
+            mines, stats = generateNoGuess(height, width, n_mines,
+                                           order.row, order.col, self._rng)
+        except RuntimeError:
+            with self._condition:
+                self._failed.add(order.config)
+            order.finish(plainMines(height, width, n_mines, order.row,
+                                    order.col), None, fallback=True)
+            return
+        order.finish(mines, stats)
+
+    def _fit(self, config, mines, starts, row, col):
+        """
+        Returns the mines of a stored grid adapted to a first click at
+        (row, col), or None if the grid does not fit it.
+        """
+        height, width, n_mines, no_guess = config
+        if not no_guess:
+            zone = set(r*width + c for r in range(row-1, row+2)
+                       for c in range(col-1, col+2)
+                       if 0 <= r < height and 0 <= c < width)
+            kept = set(mines) - zone
+            for k in range(len(mines) - len(kept)):
+                while True:
+                    i = self._rng.randrange(height*width)
+                    if i not in zone and i not in kept:
+                        break
+                kept.add(i)
+            return sorted(kept)
+
+        for flip_r in (False, True):
+            for flip_c in (False, True):
+                r = height-1 - row if flip_r else row
+                c = width-1 - col if flip_c else col
+                if starts[r*width + c]:
+                    flipped = []
+                    for i in mines:
+                        r, c = divmod(i, width)
+                        if flip_r:
+                            r = height-1 - r
+                        if flip_c:
+                            c = width-1 - c
+                        flipped.append(r*width + c)
+                    return sorted(flipped)
+        return None
+
+    def _generate(self, config):
+        """
+        Generates a grid for the pool (runs in the background thread).
+        Pauses between steps while there are orders to make.
+        """
+        height, width, n_mines, no_guess = config
+        if not no_guess:
+            return (self._rng.sample(range(height*width), n_mines),
+                    None, None)
+
+        row = self._rng.randrange(height)
+        col = self._rng.randrange(width)
+        mines, stats = generateNoGuess(height, width, n_mines, row, col,
+                                       self._rng, pause=self._pause)
+        self._pause()
+        grid = Grid(height, width, n_mines)
+        grid.placeMines(mines)
+        zero = bytes(not m and not n for m, n in zip(grid.getMines(),
+                                                      grid.getCounts()))
+
+        #connected areas of squares with no mines around
+        kinds, offsets = neighborTable(height, width)
+        areas = []
+        seen = bytearray(height*width)
+        for i in range(height*width):
+            if zero[i] and not seen[i]:
+                seen[i] = 1
+                area = [i]
+                for j in area:
+                    for d in offsets[kinds[j]]:
+                        if zero[j + d] and not seen[j + d]:
+                            seen[j + d] = 1
+                            area.append(j + d)
+                areas.append(area)
+        areas.sort(key=len, reverse=True)
+
+        starts = bytearray(height*width)
+        for area in areas[:self.max_areas]:
+            self._pause()
+            grid = Grid(height, width, n_mines)
+            grid.placeMines(mines)
+            if solveFrom(grid, *divmod(area[0], width)):
+                for i in area:
+                    starts[i] = 1
+        return mines, starts, stats
+
+    def _pause(self):
+        """
+        Waits while the order thread has orders to make, so that a first
+        click does not share the processor with the grids for later.
+        """
+        with self._condition:
+            while self._orders:
+                self._condition.wait()
+
+    def _takeOrders(self):
+        while True:
+            with self._condition:
+                while not self._orders:
+                    self._condition.wait()
+                order = self._orders[0]
+            self._fill(order)
+            with self._condition:
+                self._orders.popleft()
+                self._condition.notify_all()
+
+    def _next(self):
+        """
+        Returns the most recent configuration whose pool is not full,
+        evicting the least recently used ones while its next grid would
+        not fit in max_cells, or None if there's none or it does not fit.
+        """
+        config = next((c for c in reversed(self._pools)
+                       if len(self._pools[c]) < self.per_config
+                       and c not in self._failed), None)
+        if config is None:
+            return None
+        size = config[0]*config[1]
+        while self._cells + size > self.max_cells \
+              and next(iter(self._pools)) != config:
+            self._evict()
+        return config if self._cells + size <= self.max_cells else None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                config = self._next()
+                while config is None:
+                    self._condition.wait()
+                    config = self._next()
+                self._cells += config[0]*config[1] #room for the grid
+
+            try:
+                entry = self._generate(config)
+            except RuntimeError:
+                entry = None
+
+            with self._condition:
+                if entry is None:
+                    self._failed.add(config)
+                if entry is not None and config in self._pools:
+                    self._pools[config].append(entry)
+                else:
+                    self._cells -= config[0]*config[1]
+                self._condition.notify_all()
@@ -0,0 +1,219 @@
+import mmap
+import tempfile
+from collections import OrderedDict
+
+"""
+Module that keeps the chunks of a huge board (see lazy_grid) within a
+bounded memory: a fixed number of chunks stay in memory, in LRU order,
+and the least recently used ones are evicted to a memory-mapped spill
+file, from where they are paged back in when touched again.
+"""
+
+class Chunk:
+    """
+    Class holding the planes of a chunk (size x size squares, one byte
+    per square, indexed by local_row*size + local_col, as in game.Grid).
+    The counts are only computed when a square of the chunk is revealed,
+    since they need the mines of the neighbouring chunks. padding is the
+    number of squares of the chunk past the board's edges, and n_mines
+    the number of mines, set by whoever places them.
+    """
+
+    __slots__ = ("mines", "counts", "states", "flags", "padding", "n_mines")
+
+    def __init__(self, size, padding=0):
+        self.mines = bytearray(size*size)
+        self.counts = None
+        self.states = bytearray(size*size)
+        self.flags = bytearray(size*size)
+        self.padding = padding
+        self.n_mines = 0
+
+    def isPristine(self):
+        """
+        Returns True if no square was revealed or flagged.
+        """
+        n = len(self.states)
+        return self.states.count(0) == n and self.flags.count(0) == n
+
+    def isCold(self):
+        """
+        Returns True if nothing is left to play in the chunk: it is
+        pristine, or every safe square was revealed (the mines stay
+        hidden while the game goes on).
+        """
+        n_hidden = self.states.count(0)
+        if n_hidden == len(self.states):
+            return self.flags.count(0) == n_hidden
+        return n_hidden == self.padding + self.n_mines
+
+
+class SpillFile:
+    """
+    Class that stores the states and flags of evicted chunks in a
+    temporary file, mapped in memory and split in slots of one byte per
+    square (state | flag << 2). The file doubles when it is full, and
+    the slots of chunks paged back in are reused.
+    """
+
+    def __init__(self, chunk_size):
+        self.slot_size = chunk_size*chunk_size
+        self._file = tempfile.TemporaryFile()
+        self._map = None
+        self._n_slots = 0
+        self._free = []
+        #masks of the lowest 2 bits of every byte, to unpack the slots
+        self._low = int.from_bytes(b"\x03"*self.slot_size, "little")
+
+    def _grow(self):
+        n_slots = max(16, 2*self._n_slots)
+        if self._map is not None:
+            self._map.close()
+        self._file.truncate(n_slots*self.slot_size)
+        self._map = mmap.mmap(self._file.fileno(), n_slots*self.slot_size)
+        self._free.extend(range(n_slots-1, self._n_slots-1, -1))
+        self._n_slots = n_slots
+
+    def write(self, chunk):
+        """
+        Writes a chunk's states and flags in a free slot and returns it.
+        """
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        #every byte is at most 2 | 2 << 2, nothing carries between them
+        packed = int.from_bytes(chunk.states, "little") \
+                 | int.from_bytes(chunk.flags, "little") << 2
+        start = slot*self.slot_size
+        self._map[start:start+self.slot_size] = \
+            packed.to_bytes(self.slot_size, "little")
+        return slot
+
+    def read(self, slot, chunk):
+        """
+        Reads a slot into a chunk's states and flags, and frees it.
+        """
+        start = slot*self.slot_size
+        packed = int.from_bytes(self._map[start:start+self.slot_size],
+                                "little")
+        chunk.states[:] = (packed & self._low).to_bytes(self.slot_size,
+                                                        "little")
+        chunk.flags[:] = (packed >> 2 & self._low).to_bytes(self.slot_size,
+                                                            "little")
+        self._free.append(slot)
+
+    def getSize(self):
+        return self._n_slots*self.slot_size
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
+class ChunkStore:
+    """
+    Class that keeps the chunks of a board by their (chunk_row,
+    chunk_col), making them with make(key) the first time. At most
+    max_chunks chunks stay in memory; when there are more, the least
+    recently used one is evicted, unless one of the few next to it
+    (see window) is cold, with nothing left to play (Chunk.isCold):
+    pristine chunks are dropped, since make gives them back the same,
+    and resolved ones spill without being paged in again soon. The
+    window is kept small, since the chunks in play that are skipped
+    stay at its start until they are the only ones left in it. Evicted
+    chunks that are not pristine go to the spill file, and are paged
+    back in when they are asked for again.
+    A chunk got from the store must be used before getting more than
+    max_chunks - window - 1 others, or it may be evicted meanwhile.
+    Counts hits (chunks found in memory), misses (chunks made or paged
+    in), page-ins, evictions and spills (evictions written to the file).
+    """
+
+    MIN_CHUNKS = 16
+
+    def __init__(self, chunk_size, make, max_chunks=2048):
+        self.make = make
+        self.max_chunks = max(self.MIN_CHUNKS, max_chunks)
+        #least recently used chunks looked at for a cold one
+        self.window = min(8, self.max_chunks // 8)
+        self._chunks = OrderedDict() #chunks in memory, in LRU order
+        self._spilled = {} #key: slot in the spill file
+        self._spill = SpillFile(chunk_size)
+        self.hits = 0
+        self.misses = 0
+        self.page_ins = 0
+        self.evictions = 0
+        self.spills = 0
+
+    def get(self, key):
+        """
+        Returns a chunk, making it or paging it in if needed.
+        """
+        chunk = self._chunks.get(key)
+        if chunk is not None:
+            self._chunks.move_to_end(key)
+            self.hits += 1
+            return chunk
+
+        self.misses += 1
+        chunk = self.make(key)
+        slot = self._spilled.pop(key, None)
+        if slot is not None:
+            self._spill.read(slot, chunk)
+            self.page_ins += 1
+        self._chunks[key] = chunk
+        while len(self._chunks) > self.max_chunks:
+            self._evict()
+        return chunk
+
+    def peek(self, key):
+        """
+        Returns a chunk if it was made before (paging it in if needed),
+        or None, without making it.
+        """
+        if key in self._chunks or key in self._spilled:
+            return self.get(key)
+        return None
+
+    def _evict(self):
+        victim = None
+        for k, key in enumerate(self._chunks):
+            if k >= self.window:
+                break
+            chunk = self._chunks[key]
+            if chunk.isCold():
+                victim = key
+                break
+        if victim is None: #the cold chunks are all in play
+            victim = next(iter(self._chunks))
+        chunk = self._chunks.pop(victim)
+        self.evictions += 1
+        if not chunk.isPristine():
+            self._spilled[victim] = self._spill.write(chunk)
+            self.spills += 1
+
+    def residentItems(self):
+        """
+        Returns the (key, chunk) of the chunks in memory.
+        """
+        return list(self._chunks.items())
+
+    def keys(self):
+        """
+        Returns the keys of every chunk made, in memory or spilled.
+        """
+        return list(self._chunks) + list(self._spilled)
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def getStats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "page_ins": self.page_ins, "evictions": self.evictions,
+                "spills": self.spills, "resident": len(self._chunks),
+                "spilled": len(self._spilled),
+                "spill_bytes": self._spill.getSize()}
+
+    def close(self):
+        self._spill.close()
@@ -1,5 +1,8 @@
-from random import randint
-from matrix_expansion import findSurroundings
+import random
+from random import Random
+from collections import deque
+from matrix_expansion import neighborTable
+from board_file import BoardFile, writeBoard
 
 ## colors:
 ## blue = #cfe2f3 < #9fc5e8 < #6fa8dc
@@ -9,26 +12,53 @@ from matrix_expansion import findSurroundings
 ##
 ## \u2620 = skull and bones
 ## \u2691 = flag
+##
+## the grid keeps one byte per square in each of four planes
+## (bytearrays indexed by row*width + col):
+## mines = 0 (safe), 1 (mine)
+## counts = 0-8, number of mines around the square
+## states = 0 (hidden), 1 (revealed), 2 (shown at game's end)
+## flags = 0 (""), 1 ("\u2691"), 2 ("?")
+
+FLAGS = ("", "\u2691", "?")
+
+def countPlane(mines, height, width):
+    """
+    Counts the mines around every square of a mines plane in one pass,
+    as a 3x3 sum over the whole board.
+    The plane is read as a single integer with one byte per square, so
+    adding shifted copies of it sums every byte at once (a byte never
+    gets past 9, so nothing carries into the next one). The shifts by
+    one byte are masked so that they do not wrap between rows.
+    """
+    n = height*width
+    plane = int.from_bytes(mines, "little")
+    no_last_col = int.from_bytes((b"\xff"*(width-1) + b"\x00") * height,
+                                 "little")
+    no_first_col = int.from_bytes((b"\x00" + b"\xff"*(width-1)) * height,
+                                  "little")
+
+    rows = plane + ((plane & no_last_col) << 8) + ((plane & no_first_col) >> 8)
+    total = rows + (rows << 8*width) + (rows >> 8*width)
+    total &= (1 << 8*n) - 1 #drops what was shifted past the last row
+
+    return (total - plane).to_bytes(n, "little")
 
 class Square:
     """
     Class representing all squares in the rectangular grid of the game.
-    Each square has a tkinter Button as an internal attribute.
-    Has also three important attributes: state, value and flag.
+    It is only a view over the grid's planes: it keeps no game state
+    of its own, so it is cheap to create whenever needed.
+    Has three important attributes: state, value and flag.
     """
 
-    def __init__(self, row, col):
+    __slots__ = ("_grid", "_row", "_col", "_i")
+
+    def __init__(self, grid, row, col):
+        self._grid = grid
         self._row = row
         self._col = col
-        self._state = 0 # 0, 1
-        self._value = " " # " ", "1-8", "\u2620"
-        self._flag = "" # "\u2691", "?"
-
-    def setButton(self, new_button):
-        self._button = new_button
-
-    def getButton(self):
-        return self._button
+        self._i = row*grid.getWidth() + col
 
     def getRow(self):
         return self._row
@@ -37,38 +67,44 @@ class Square:
         return self._col
 
     def getState(self):
-        return self._state
+        return self._grid._states[self._i]
 
-    def disable(self):
-        self._state = 1
-        self._button.config(state="disabled", bg="#cfe2f3",
-                            disabledforeground="black",
-                            text=self._value)
+    def disable(self, state=1):
+        self._grid._states[self._i] = state
 
     def getValue(self):
-        return self._value
+        """
+        Returns "\u2620" for mines, the number of mines around revealed
+        squares ("1-8") and " " for anything else.
+        """
+        if self._grid._mines[self._i]:
+            return "\u2620"
+        if self._grid._states[self._i] == 1 and self._grid._counts[self._i]:
+            return str(self._grid._counts[self._i])
+        return " "
 
     def setValue(self, new_value):
-        self._value = new_value
-        if self._state == 1:
-            self._button["text"] = str(new_value)
+        """
+        Only mines are stored, numbers come from the grid's counts.
+        """
+        self._grid._mines[self._i] = new_value == "\u2620"
 
     def getFlag(self):
-        return self._flag
+        return FLAGS[self._grid._flags[self._i]]
 
     def setFlag(self, new_flag):
-        self._flag = new_flag
-        if new_flag: #isn't empty string
-            self._button["text"] = str(new_flag)
-        else:
-            self._button["text"] = " "
+        self._grid._flags[self._i] = FLAGS.index(new_flag)
 
 class Grid:
     """
-    Class containing the game's grid. Every square of the grid
-    is a Square object.
+    Class containing the game's grid. The squares' data is kept in flat
+    bytearrays (see the planes at the top of the module), and every
+    Square object is a view over them.
     Has methods to handle number of flags, set and count mines,
     expand from a position, and others.
+    The grid has no GUI code: the moves (reveal, toggleFlag and chord)
+    return the positions of the squares they changed, and every listener
+    added with subscribe is called with these same positions.
     """
 
     def __init__(self, height, width, n_mines):
@@ -76,15 +112,21 @@ class Grid:
         self._width = width
         self._n_mines = n_mines
 
-        self._grid = []
-        for r in range(height):
-            row = []
-            for c in range(width):
-                sq = Square(r, c)
-                row.append(sq)
-            self._grid.append(row)
+        self._mines = bytearray(height*width)
+        self._counts = bytearray(height*width)
+        self._states = bytearray(height*width)
+        self._flags = bytearray(height*width)
+        #squares already reached by a flood fill (they stay revealed)
+        self._visited = bytearray(height*width)
+        self._kinds, self._offsets = neighborTable(height, width)
 
         self._n_flagged_squares = 0
+        #safe squares still hidden, the game is won when it reaches 0
+        self._n_safe_hidden = height*width - n_mines
+        self._exploded = None #position of the mine that ended the game
+        self._placed = False #mines already placed
+        self._seed = None #seed of the mines, if they came from one
+        self._listeners = []
 
     def getHeight(self):
         return self._height
@@ -96,10 +138,27 @@ class Grid:
         return self._n_mines
 
     def getGrid(self):
-        return self._grid
+        """
+        Returns every square as a list of rows. Creates a view for each
+        square, so prefer getSquare.
+        """
+        return [[Square(self, r, c) for c in range(self._width)]
+                for r in range(self._height)]
 
     def getSquare(self, row, col):
-        return self._grid[row][col]
+        return Square(self, row, col)
+
+    def hasMines(self):
+        return self._placed
+
+    def getSeed(self):
+        return self._seed
+
+    def getExploded(self):
+        return self._exploded
+
+    def isLost(self):
+        return self._exploded is not None
 
     def addFlaggedSquare(self):
         self._n_flagged_squares += 1
@@ -110,76 +169,341 @@ class Grid:
     def getNFlaggedSquares(self):
         return self._n_flagged_squares
 
-    def setMines(self, row, col):
+    def getNSafeHidden(self):
+        return self._n_safe_hidden
+
+    def getProgress(self):
+        """
+        Returns the percentage of safe squares already revealed.
+        """
+        n_safe = self._height*self._width - self._n_mines
+        return 100 * (n_safe - self._n_safe_hidden) / n_safe
+
+    def subscribe(self, listener):
+        """
+        Adds a function that is called with the list of changed
+        positions after every move.
+        """
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self._listeners.remove(listener)
+
+    def _notify(self, changes):
+        if changes:
+            for listener in self._listeners:
+                listener(changes)
+        return changes
+
+    def setMines(self, row, col, rng=None):
+        """
+        Places the mines anywhere but in the first square clicked and its
+        surroundings. The mines are sampled from the allowed squares'
+        indexes, so it takes linear time whatever the density.
+        rng may be a random.Random or a seed, to get the same layout
+        again; by default the random module is used.
+        """
+        if rng is None:
+            rng = random
+        elif not isinstance(rng, Random):
+            self._seed = rng
+            rng = Random(rng)
+
+        first = row*self._width + col
+        safe = sorted([first + d for d in self._offsets[self._kinds[first]]]
+                      + [first])
+
         mines = []
-        surr_first = findSurroundings(self._grid, [row, col])
-
-        for n in range(self._n_mines):
-            while True:
-                mi = randint(0, self._height-1)
-                mj = randint(0, self._width-1)
-                if [mi, mj] != [row, col] and [mi, mj] not in surr_first \
-                   and [mi, mj] not in mines:
+        for k in rng.sample(range(self._height*self._width - len(safe)),
+                            self._n_mines):
+            #the k-th allowed index skips every safe index up to it
+            for s in safe:
+                if s > k:
                     break
-            mines.append([mi, mj])
-
-        for row, col in mines:
-            self.getSquare(row, col).setValue("\u2620") #skull and bones
+                k += 1
+            mines.append(k)
+
+        self.placeMines(mines)
+
+    def placeMines(self, mines):
+        """
+        Puts mines at the given indexes (row*width + col) and counts
+        the mines around every square.
+        """
+        for i in mines:
+            self._mines[i] = 1
+        self._counts[:] = countPlane(self._mines, self._height, self._width)
+        self._placed = True
+
+    def getMines(self):
+        """
+        Returns the mines plane (one byte per square, row by row).
+        """
+        return self._mines
+
+    def getStates(self):
+        """
+        Returns the states plane (one byte per square, row by row).
+        """
+        return self._states
+
+    def getFlags(self):
+        """
+        Returns the flags plane (one byte per square, row by row).
+        """
+        return self._flags
+
+    def getCounts(self):
+        """
+        Returns the plane with the number of mines around every square
+        (one byte per square, row by row).
+        """
+        return self._counts
 
     def countMines(self, row, col):
-        surr_pos = findSurroundings(self._grid, [row, col])
-        n_mines = 0
-        for row, col in surr_pos:
-            if self.getSquare(row, col).getValue() == "\u2620":
-                n_mines += 1
-
-        return n_mines
+        return self._counts[row*self._width + col]
 
     def expandPosition(self, row, col):
-       checking = [[row, col]]
-
-       to_check = []
-
-       while checking != []:
-
-           for row, col in checking:
-               if self.getSquare(row, col).getState() == 0 \
-               and self.getSquare(row, col).getValue() == " ":
-                    self.getSquare(row, col).disable()
-                    if self.getSquare(row, col).getFlag() == "\u2691":
-                        self.removeFlaggedSquare()
-                    self.getSquare(row, col).setFlag("")
-
-                    n_mines = self.countMines(row, col)
-                    if n_mines > 0:
-                        self.getSquare(row, col).setValue(str(n_mines))
-                    else:
-                        surr_pos = findSurroundings(self._grid, [row, col])
-                        for p in surr_pos:
-                            if p not in to_check and p not in checking:
-                                to_check.append(p)
+        """
+        Reveals the square and, while the revealed squares have no mines
+        around them, their surroundings too (breadth-first).
+        Every square is queued at most once, so the cost only depends on
+        the number of squares revealed.
+        Returns the positions of the squares revealed, in reveal order.
+        """
+        return self._expand([row*self._width + col])
+
+    def _expand(self, starts):
+        """
+        Flood fill of expandPosition from several squares at once (indexes
+        row*width + col), so their areas are revealed in a single pass.
+        """
+        opened = []
+        for part in self._expandSteps(starts):
+            opened.extend(part)
+        return opened
+
+    def _expandSteps(self, starts, step=None):
+        """
+        Generator doing the flood fill of _expand. Yields the positions
+        revealed every step squares (once at the end if step is None),
+        so that a big cascade can be spread over several calls.
+        """
+        mines = self._mines
+        counts = self._counts
+        states = self._states
+        flags = self._flags
+        visited = self._visited
+        kinds = self._kinds
+        offsets = self._offsets
+        width = self._width
+
+        for start in starts:
+            visited[start] = 1
+        frontier = deque(starts)
+        opened = []
+
+        while frontier:
+            i = frontier.popleft()
+            if states[i] != 0 or mines[i]:
+                continue
+
+            states[i] = 1
+            self._n_safe_hidden -= 1
+            opened.append(divmod(i, width))
+            if flags[i] == 1:
+                self.removeFlaggedSquare()
+            flags[i] = 0
+
+            if counts[i] == 0:
+                for d in offsets[kinds[i]]:
+                    if not visited[i + d]:
+                        visited[i + d] = 1
+                        frontier.append(i + d)
+
+            if step and len(opened) >= step:
+                yield opened
+                opened = []
+
+        yield opened
+
+    def reveal(self, row, col):
+        """
+        Reveals a square. If it is a mine, the game is lost and the
+        whole grid is shown. Otherwise, expands the grid from it.
+        Returns the positions of the squares changed.
+        """
+        changes = []
+        for part in self.revealSteps(row, col):
+            changes.extend(part)
+        return changes
+
+    def revealSteps(self, row, col, step=None):
+        """
+        Generator version of reveal: the expansion is done step squares
+        at a time (see _expandSteps), and the listeners are called with
+        the squares changed in each step, which are also yielded.
+        """
+        i = row*self._width + col
+        if self._states[i] != 0:
+            return
+
+        if self._mines[i]:
+            self._exploded = (row, col)
+            yield self._notify(self._showAll(lose=True))
+            return
+
+        for part in self._expandSteps([i], step):
+            yield self._notify(part)
+
+    def toggleFlag(self, row, col):
+        """
+        Cycles the flag of an unrevealed square: no flag, flag and
+        question mark. When all flags are used, goes straight to the
+        question mark.
+        Returns the positions of the squares changed.
+        """
+        i = row*self._width + col
+        if self._states[i] != 0:
+            return []
+
+        if self._flags[i] == 0:
+            if self._n_flagged_squares < self._n_mines:
+                self._flags[i] = 1
+                self.addFlaggedSquare()
+            else:
+                self._flags[i] = 2
+        elif self._flags[i] == 1:
+            self._flags[i] = 2
+            self.removeFlaggedSquare()
+        else:
+            self._flags[i] = 0
+
+        return self._notify([(row, col)])
+
+    def chord(self, row, col):
+        """
+        Reveals every unflagged square around a revealed number, as long
+        as the number of flags around it matches the number.
+        A wrongly placed flag makes the chord hit a mine.
+        The squares opened and the areas they expand to are revealed in
+        one flood fill, and the listeners are called once for all.
+        Returns the positions of the squares changed.
+        """
+        changes = []
+        for part in self.chordSteps(row, col):
+            changes.extend(part)
+        return changes
+
+    def chordSteps(self, row, col, step=None):
+        """
+        Generator version of chord, in the way of revealSteps.
+        """
+        i = row*self._width + col
+        if self._states[i] != 1 or self._counts[i] == 0:
+            return
+
+        surr = self._offsets[self._kinds[i]]
+        n_flags = 0
+        for d in surr:
+            if self._flags[i + d] == 1:
+                n_flags += 1
+        if n_flags != self._counts[i]:
+            return
+
+        starts = []
+        for d in surr:
+            j = i + d
+            if self._states[j] != 0 or self._flags[j] == 1:
+                continue
+            if self._mines[j]: #wrong flag somewhere
+                self._exploded = divmod(j, self._width)
+                yield self._notify(self._showAll(lose=True))
+                return
+            starts.append(j)
+
+        for part in self._expandSteps(starts, step):
+            yield self._notify(part)
+
+    def move(self, kind, row, col):
+        """
+        Plays a move by its kind: "reveal", "flag" or "chord" (the kinds
+        kept by recorders and board files).
+        Returns the positions of the squares changed.
+        """
+        if kind == "reveal":
+            return self.reveal(row, col)
+        if kind == "flag":
+            return self.toggleFlag(row, col)
+        if kind == "chord":
+            return self.chord(row, col)
+        raise ValueError("unknown move {!r}".format(kind))
+
+    def moveSteps(self, kind, row, col, step=256):
+        """
+        Generator version of move, which does a reveal or a chord step
+        squares at a time (see revealSteps), so that the GUI can spread a
+        big cascade over several frames. Each next() does one step and
+        returns the positions of the squares changed in it.
+        """
+        if kind == "reveal":
+            yield from self.revealSteps(row, col, step)
+        elif kind == "chord":
+            yield from self.chordSteps(row, col, step)
+        else:
+            yield self.move(kind, row, col)
 
-           checking = to_check[:]
-           del to_check[:]
+    def hadVictory(self):
+        return self._n_safe_hidden == 0
 
     def showAll(self, win=False, lose=False):
-        for r in self._grid:
-            for sq in r:
-                if win:
-                    sq.disable()
-                    if sq.getValue() == "\u2620":
-                        sq.setFlag("\u2691")
-                        sq.getButton()["bg"] = "#6fa8dc"
-                        self._n_flagged_squares = self._n_mines
-                if lose:
-                    if sq.getState() == 0:
-                        sq.disable()
-                        sq.getButton()["bg"] = "#6fa8dc"
-                    else:
-                        sq.disable()
-                    if sq.getFlag() == "\u2691":
-                        if sq.getValue() != "\u2620":
-                            sq.getButton().config(text="\u2691",
-                                                  disabledforeground="red")
-                        else:
-                            sq.getButton().config(text="\u2691")
+        """
+        Shows every square when the game ends.
+        Returns the positions of the squares changed.
+        """
+        return self._notify(self._showAll(win, lose))
+
+    def _showAll(self, win=False, lose=False):
+        changes = []
+        for i in range(self._height*self._width):
+            if win:
+                if self._mines[i]:
+                    self._states[i] = 2
+                    self._flags[i] = 1
+                    self._n_flagged_squares = self._n_mines
+                    changes.append(divmod(i, self._width))
+            if lose:
+                if self._states[i] == 0:
+                    self._states[i] = 2
+                    changes.append(divmod(i, self._width))
+        return changes
+
+    def save(self, path, moves=()):
+        """
+        Saves the grid's mines (and its seed, if it is an integer that
+        fits in the file's 8 bytes) in a board file, with the moves given
+        as (kind, row, col, milliseconds since the game started). See
+        board_file.
+        """
+        seed = self._seed
+        if not isinstance(seed, int) or not -2**63 <= seed < 2**63:
+            seed = None
+        writeBoard(path, self._height, self._width, self._n_mines,
+                   self._mines, seed, moves)
+
+
+def loadGrid(path, replay=True):
+    """
+    Creates a grid from a board file, with its mines placed and, if
+    replay is True, its moves played again.
+    """
+    with BoardFile(path) as board:
+        grid = Grid(board.height, board.width, board.n_mines)
+        grid._seed = board.seed
+        grid._mines[:] = board.getMines()
+        grid._counts[:] = countPlane(grid._mines, grid._height, grid._width)
+        grid._placed = True
+        if replay:
+            for kind, row, col, time in board.iterMoves():
+                grid.move(kind, row, col)
+    return grid
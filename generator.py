@@ -0,0 +1,97 @@
+from time import perf_counter
+from random import Random
+from game import Grid
+from solver import Solver, solveFrom
+
+"""
+Module that generates grids that can be solved from the first click
+without guessing (no-guess grids).
+"""
+
+def generateNoGuess(height, width, n_mines, row, col, rng=None,
+                    max_attempts=50, max_repairs=None, pause=None):
+    """
+    Generates the mines of a grid that the solver wins from (row, col)
+    without guessing.
+    Each attempt places the mines at random and plays the grid with the
+    solver. When the solver gets stuck, the grid is repaired: a mine on
+    the frontier is moved to a hidden square away from it, and the grid
+    is played again from the first click, so every repair costs a whole
+    play of the grid (O(squares)); only picking the square to move the
+    mine to is O(1). After max_repairs repairs (by default, one per mine)
+    the attempt is dropped and a new one starts.
+    rng may be a random.Random or a seed, to get the same grid again.
+    pause, if given, is called before every play of the grid, so a
+    caller running this in the background can hold it between steps.
+    Returns the mines (indexes row*width + col) and the generation's
+    statistics: {"attempts", "repairs", "time"} (time in seconds).
+    Raises RuntimeError if no grid is found in max_attempts attempts.
+    """
+    start = perf_counter()
+    if not isinstance(rng, Random):
+        rng = Random(rng)
+    if max_repairs is None:
+        max_repairs = n_mines
+
+    safe_zone = set((r, c) for r in range(row-1, row+2)
+                    for c in range(col-1, col+2))
+
+    repairs = 0
+    for attempt in range(1, max_attempts + 1):
+        grid = Grid(height, width, n_mines)
+        grid.setMines(row, col, rng)
+        mines = set(i for i, m in enumerate(grid.getMines()) if m)
+        #squares a mine may move to (no mine, away from the first click),
+        #with their place in the list, to pick and update them in O(1)
+        spots = [i for i in range(height*width) if i not in mines
+                 and divmod(i, width) not in safe_zone]
+        where = {i: k for k, i in enumerate(spots)}
+
+        for n in range(max_repairs + 1):
+            if pause is not None:
+                pause()
+            if n > 0:
+                grid = Grid(height, width, n_mines)
+                grid.placeMines(mines)
+            solver = Solver(grid)
+            if solveFrom(grid, row, col, solver):
+                return sorted(mines), {"attempts": attempt,
+                                       "repairs": repairs,
+                                       "time": perf_counter() - start}
+            if n == max_repairs:
+                break
+
+            #move a mine of the frontier somewhere still hidden
+            frontier = solver.getFrontier()
+            stuck = [r*width + c for r, c in frontier
+                     if r*width + c in mines]
+            states = grid.getStates()
+            frontier = set(r*width + c for r, c in frontier)
+            target = None
+            #most spots are hidden, try a few at random
+            for k in range(64 if spots else 0):
+                i = rng.choice(spots)
+                if states[i] == 0 and i not in frontier:
+                    target = i
+                    break
+            else:
+                free = [i for i in spots
+                        if states[i] == 0 and i not in frontier]
+                if free:
+                    target = rng.choice(free)
+            if not stuck or target is None:
+                break
+            moved = rng.choice(stuck)
+            mines.remove(moved)
+            mines.add(target)
+            last = spots.pop()
+            if last != target:
+                spots[where[target]] = last
+                where[last] = where[target]
+            del where[target]
+            where[moved] = len(spots)
+            spots.append(moved)
+            repairs += 1
+
+    raise RuntimeError("no grid without guesses found in {} attempts"
+                       .format(max_attempts))
@@ -0,0 +1,159 @@
+import json
+from collections import deque
+from time import perf_counter_ns
+
+"""
+Module that measures how long each move takes, from the click to the
+end of its redraw, split in phases:
+    hit-test = finding the square clicked
+    engine = the grid's move and the updates of the labels
+    render = drawing the changed squares
+    total = from the click until the squares are drawn (includes the
+            wait behind earlier moves, the grid's generation and the
+            wait for tkinter to be idle)
+"""
+
+PHASES = ("hit-test", "engine", "render", "total")
+
+class RollingStats:
+    """
+    Class that keeps the last size samples (nanoseconds) and computes
+    their percentiles.
+    """
+
+    def __init__(self, size=1000):
+        self.samples = deque(maxlen=size)
+        self.count = 0 #samples added, including the ones dropped
+
+    def add(self, ns):
+        self.samples.append(ns)
+        self.count += 1
+
+    def percentile(self, p):
+        """
+        Returns the p-th percentile (nearest rank) in nanoseconds, or
+        None if there are no samples.
+        """
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[max(0, -(-len(ordered)*p // 100) - 1)]
+
+    def getSummary(self):
+        return {"count": self.count,
+                "p50": self.percentile(50),
+                "p95": self.percentile(95),
+                "p99": self.percentile(99)}
+
+
+class LatencyMonitor:
+    """
+    Class that times the phases of every move with perf_counter_ns and
+    keeps rolling statistics for each phase.
+    A move is timed by calling begin when its event arrives, mark after
+    each phase done in the event's handler, finish when the handler
+    returns (or cancel, if the event made no move), and done, with the
+    time returned by begin, once the move has been played; its total
+    is taken at the renderer's next flush (see rendered). Moves may be
+    queued, so every one keeps its own start.
+    Listeners added with subscribe are called after every rendered move.
+    """
+
+    def __init__(self, size=1000):
+        self.stats = {phase: RollingStats(size) for phase in PHASES}
+        self._current = None #phase: nanoseconds of the move being handled
+        self._drawing = [] #starts of the moves played, not drawn yet
+        self._last = None
+        self._listeners = []
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def begin(self):
+        """
+        Starts timing an event. Returns its time, to give to done.
+        """
+        self._current = dict.fromkeys(PHASES[:2], 0)
+        self._last = perf_counter_ns()
+        return self._last
+
+    def mark(self, phase):
+        """
+        Adds the time since the last mark (or begin) to a phase.
+        """
+        if self._current is None:
+            return
+        now = perf_counter_ns()
+        self._current[phase] += now - self._last
+        self._last = now
+
+    def finish(self):
+        """
+        Ends the event's handler: the time since the last mark goes to
+        the engine phase.
+        """
+        if self._current is None:
+            return
+        self.mark("engine")
+        for phase, ns in self._current.items():
+            self.stats[phase].add(ns)
+        self._current = None
+
+    def cancel(self):
+        """
+        Drops the move being timed, for events that did not make one.
+        """
+        self._current = None
+
+    def done(self, start, drawing=True):
+        """
+        Called when the move begun at start has been played. Its total
+        is taken at the next flush, or now if no flush is coming
+        (drawing False: nothing to draw, or already drawn).
+        """
+        if drawing:
+            self._drawing.append(start)
+        else:
+            self.stats["total"].add(perf_counter_ns() - start)
+
+    def rendered(self, ns):
+        """
+        Called by the renderer after a flush that took ns nanoseconds.
+        """
+        self.stats["render"].add(ns)
+        now = perf_counter_ns()
+        for start in self._drawing:
+            self.stats["total"].add(now - start)
+        self._drawing = []
+        for listener in self._listeners:
+            listener()
+
+    def getSummary(self):
+        return {phase: self.stats[phase].getSummary() for phase in PHASES}
+
+    def toJSON(self):
+        """
+        Returns the statistics and the samples kept of every phase, in
+        nanoseconds, as a JSON string.
+        """
+        return json.dumps({"summary": self.getSummary(),
+                           "samples": {phase: list(self.stats[phase].samples)
+                                       for phase in PHASES}})
+
+    def save(self, path):
+        with open(path, "w") as f:
+            f.write(self.toJSON())
+
+    def getText(self):
+        """
+        Returns the statistics as lines of text, in milliseconds.
+        """
+        lines = ["{:<8} {:>5} {:>5} {:>5}".format("ms", "p50", "p95", "p99")]
+        for phase in PHASES:
+            values = []
+            for p in (50, 95, 99):
+                ns = self.stats[phase].percentile(p)
+                values.append("-" if ns is None else
+                              "{:.2f}".format(ns / 1e6))
+            lines.append("{:<8} {:>5} {:>5} {:>5}".format(phase, *values))
+        return "\n".join(lines)
@@ -0,0 +1,406 @@
+import random
+from random import Random
+from collections import deque
+from game import Grid, countPlane, FLAGS
+from matrix_expansion import ringOffsets
+from chunk_store import Chunk, ChunkStore
+
+"""
+Module with a grid for boards too big to keep in memory (up to about
+10^6 x 10^6 squares). The board is split in square chunks, and a chunk
+only exists once a move reaches it or one of its neighbours: the mines
+of each chunk come from the grid's seed and the chunk's coordinates, so
+any chunk can be made at any time and always gets the same mines.
+The chunks are kept in a chunk_store.ChunkStore, so only a bounded
+number of them stays in memory however long the game goes on.
+"""
+
+RING = ringOffsets(1)
+LAZY_CELLS = 1000*1000 #boards with more squares are played on a LazyGrid
+#below it, the first click of a huge board may open a huge area
+MIN_DENSITY = 0.1
+
+class LazySquare:
+    """
+    View of a square of a LazyGrid, with the same methods as
+    game.Square. Reading the state or flag of a square in a chunk that
+    does not exist yet does not create it.
+    """
+
+    __slots__ = ("_grid", "_row", "_col")
+
+    def __init__(self, grid, row, col):
+        self._grid = grid
+        self._row = row
+        self._col = col
+
+    def getRow(self):
+        return self._row
+
+    def getCol(self):
+        return self._col
+
+    def getState(self):
+        chunk, i = self._grid._peek(self._row, self._col)
+        return chunk.states[i] if chunk is not None else 0
+
+    def getValue(self):
+        chunk, i = self._grid._locate(self._row, self._col, counts=True)
+        if chunk.mines[i]:
+            return "\u2620"
+        if chunk.states[i] == 1 and chunk.counts[i]:
+            return str(chunk.counts[i])
+        return " "
+
+    def getFlag(self):
+        chunk, i = self._grid._peek(self._row, self._col)
+        return FLAGS[chunk.flags[i]] if chunk is not None else ""
+
+
+class LazyGrid(Grid):
+    """
+    Grid whose squares are kept in chunks made on demand (see the
+    module's docstring). It has the moves, listeners and counters of
+    game.Grid, but no whole-board view: getMines, getStates, getFlags
+    and getCounts are not available, getGrid raises TypeError (use
+    getSquare instead), and when the game is lost only the squares of
+    the chunks in the store are shown.
+    At most max_chunks chunks are kept in memory, see ChunkStore.
+
+    Each chunk gets its share of the mines in proportion to its squares
+    (chunks are taken row by row and the shares are rounded so that they
+    add up to n_mines), placed at random with the chunk's own seed.
+    The first click's surroundings are left out of the sampling.
+    With less than MIN_DENSITY mines per square, the areas with no mines
+    around tend to join up, and the first click may open most of the
+    board; keep the density above it.
+    """
+
+    def __init__(self, height, width, n_mines, chunk_size=64,
+                 max_chunks=2048):
+        #no planes: everything whole-board in Grid.__init__ is left out
+        self._height = height
+        self._width = width
+        self._n_mines = n_mines
+        self._size = chunk_size
+        self._n_chunk_cols = -(-width // chunk_size)
+
+        self._chunks = ChunkStore(chunk_size, self._makeChunk, max_chunks)
+        self._safe = set() #first click and its surroundings
+        self._short = set() #chunks with fewer mines than their share
+
+        self._n_flagged_squares = 0
+        self._n_safe_hidden = height*width - n_mines
+        self._exploded = None
+        self._placed = False
+        self._seed = None
+        self._listeners = []
+
+    def getChunkSize(self):
+        return self._size
+
+    def getNChunks(self):
+        """
+        Returns the number of chunks in memory.
+        """
+        return len(self._chunks)
+
+    def getStoreStats(self):
+        """
+        Returns the counters of the chunk store (see ChunkStore).
+        """
+        return self._chunks.getStats()
+
+    def close(self):
+        """
+        Closes the chunk store's spill file.
+        """
+        self._chunks.close()
+
+    def getSquare(self, row, col):
+        return LazySquare(self, row, col)
+
+    def getGrid(self):
+        raise TypeError("a LazyGrid has no whole-board view, "
+                        "use getSquare")
+
+    def setMines(self, row, col, rng=None):
+        """
+        Sets the seed of the chunks' mines, leaving out the first square
+        clicked and its surroundings. rng may be a seed or a
+        random.Random (the seed is then drawn from it); by default a
+        random seed is used.
+        """
+        if rng is None:
+            rng = random.getrandbits(64)
+        elif isinstance(rng, Random):
+            rng = rng.getrandbits(64)
+        self._seed = rng
+
+        self._safe = set([(row, col)])
+        for dr, dc in RING:
+            if 0 <= row+dr < self._height and 0 <= col+dc < self._width:
+                self._safe.add((row+dr, col+dc))
+
+        self._placed = True
+        for key, chunk in self._chunks.residentItems(): #flagged before
+            self._fillMines(key, chunk)
+
+    def _chunkMines(self, key):
+        """
+        Returns the number of mines of a chunk: the share of the mines
+        of all the chunks up to it, minus the share of the ones before it.
+        """
+        size = self._size
+        q = key[0]*self._n_chunk_cols + key[1]
+
+        def cells(q):
+            """
+            Squares in the chunks before the q-th one (row by row).
+            """
+            cr, cc = divmod(q, self._n_chunk_cols)
+            rows = min(size, self._height - cr*size)
+            return min(cr*size, self._height)*self._width \
+                   + max(0, rows)*min(cc*size, self._width)
+
+        n = self._height*self._width
+        return self._n_mines*cells(q+1) // n - self._n_mines*cells(q) // n
+
+    def _fillMines(self, key, chunk):
+        size = self._size
+        top = key[0]*size
+        left = key[1]*size
+        free = [lr*size + lc
+                for lr in range(min(size, self._height - top))
+                for lc in range(min(size, self._width - left))
+                if (top+lr, left+lc) not in self._safe]
+
+        n_mines = self._chunkMines(key)
+        if n_mines > len(free): #tiny chunk at the first click
+            if key not in self._short: #counted once, even if made again
+                self._short.add(key)
+                self._n_safe_hidden += n_mines - len(free)
+            n_mines = len(free)
+        rng = Random("{}:{}:{}".format(self._seed, *key))
+        for k in rng.sample(range(len(free)), n_mines):
+            chunk.mines[free[k]] = 1
+        chunk.n_mines = n_mines
+
+    def _makeChunk(self, key):
+        """
+        Makes a chunk for the store, with its mines if they are placed.
+        """
+        size = self._size
+        rows = min(size, self._height - key[0]*size)
+        cols = min(size, self._width - key[1]*size)
+        chunk = Chunk(size, size*size - rows*cols)
+        if self._placed:
+            self._fillMines(key, chunk)
+        return chunk
+
+    def _getChunk(self, key):
+        """
+        Returns a chunk from the store, which makes it or pages it in if
+        needed.
+        """
+        return self._chunks.get(key)
+
+    def _countChunk(self, key, chunk):
+        """
+        Counts the mines around the squares of a chunk with
+        game.countPlane, over the chunk padded with the border squares of
+        its neighbours (which are made if needed).
+        """
+        size = self._size
+        cr, cc = key
+        n_rows = -(-self._height // size)
+
+        def minesRow(r, c, lr):
+            if 0 <= r < n_rows and 0 <= c < self._n_chunk_cols:
+                mines = self._getChunk((r, c)).mines
+                return mines[lr*size:(lr+1)*size]
+            return bytes(size)
+
+        padded = bytearray()
+        for pr in range(-1, size+1):
+            r = cr + (pr // size) #-1, 0 or +1 chunk rows away
+            lr = pr % size
+            padded += minesRow(r, cc-1, lr)[-1:]
+            padded += minesRow(r, cc, lr)
+            padded += minesRow(r, cc+1, lr)[:1]
+
+        counts = countPlane(padded, size+2, size+2)
+        chunk.counts = bytearray()
+        for lr in range(size):
+            start = (lr+1)*(size+2) + 1
+            chunk.counts += counts[start:start+size]
+
+    def _locate(self, row, col, counts=False):
+        """
+        Returns (chunk, local index) of a square, making the chunk (and
+        its counts, if asked for) if needed.
+        """
+        key = (row // self._size, col // self._size)
+        chunk = self._getChunk(key)
+        if counts and chunk.counts is None:
+            self._countChunk(key, chunk)
+        return chunk, (row % self._size)*self._size + col % self._size
+
+    def _peek(self, row, col):
+        """
+        Like _locate, but returns (None, local index) instead of making
+        a chunk.
+        """
+        chunk = self._chunks.peek((row // self._size, col // self._size))
+        return chunk, (row % self._size)*self._size + col % self._size
+
+    def countMines(self, row, col):
+        chunk, i = self._locate(row, col, counts=True)
+        return chunk.counts[i]
+
+    def _surroundings(self, row, col):
+        for dr, dc in RING:
+            r = row + dr
+            c = col + dc
+            if 0 <= r < self._height and 0 <= c < self._width:
+                yield r, c
+
+    def expandPosition(self, row, col):
+        return self._expand([(row, col)])
+
+    def _expandSteps(self, starts, step=None):
+        """
+        Flood fill of game.Grid._expandSteps over the chunks, making
+        them as it reaches them. starts are positions (row, col).
+        """
+        queued = set(starts)
+        frontier = deque(starts)
+        opened = []
+
+        while frontier:
+            row, col = frontier.popleft()
+            chunk, i = self._locate(row, col, counts=True)
+            if chunk.states[i] != 0 or chunk.mines[i]:
+                continue
+
+            chunk.states[i] = 1
+            self._n_safe_hidden -= 1
+            opened.append((row, col))
+            if chunk.flags[i] == 1:
+                self.removeFlaggedSquare()
+            chunk.flags[i] = 0
+
+            if chunk.counts[i] == 0:
+                for pos in self._surroundings(row, col):
+                    if pos not in queued:
+                        queued.add(pos)
+                        frontier.append(pos)
+
+            if step and len(opened) >= step:
+                yield opened
+                opened = []
+
+        yield opened
+
+    def revealSteps(self, row, col, step=None):
+        if self._exploded is not None:
+            return
+        chunk, i = self._locate(row, col)
+        if chunk.states[i] != 0:
+            return
+
+        if chunk.mines[i]:
+            self._exploded = (row, col)
+            for part in self._showAllSteps(lose=True, step=step):
+                yield self._notify(part)
+            return
+
+        for part in self._expandSteps([(row, col)], step):
+            yield self._notify(part)
+
+    def toggleFlag(self, row, col):
+        if self._exploded is not None:
+            return [] #squares out of the store are still hidden
+        chunk, i = self._locate(row, col)
+        if chunk.states[i] != 0:
+            return []
+
+        if chunk.flags[i] == 0:
+            if self._n_flagged_squares < self._n_mines:
+                chunk.flags[i] = 1
+                self.addFlaggedSquare()
+            else:
+                chunk.flags[i] = 2
+        elif chunk.flags[i] == 1:
+            chunk.flags[i] = 2
+            self.removeFlaggedSquare()
+        else:
+            chunk.flags[i] = 0
+
+        return self._notify([(row, col)])
+
+    def chordSteps(self, row, col, step=None):
+        if self._exploded is not None:
+            return
+        chunk, i = self._locate(row, col, counts=True)
+        if chunk.states[i] != 1 or chunk.counts[i] == 0:
+            return
+
+        surr = list(self._surroundings(row, col))
+        n_flags = 0
+        for r, c in surr:
+            if self.getSquare(r, c).getFlag() == "\u2691":
+                n_flags += 1
+        if n_flags != chunk.counts[i]:
+            return
+
+        starts = []
+        for r, c in surr:
+            other, j = self._locate(r, c)
+            if other.states[j] != 0 or other.flags[j] == 1:
+                continue
+            if other.mines[j]: #wrong flag somewhere
+                self._exploded = (r, c)
+                for part in self._showAllSteps(lose=True, step=step):
+                    yield self._notify(part)
+                return
+            starts.append((r, c))
+
+        for part in self._expandSteps(starts, step):
+            yield self._notify(part)
+
+    def _showAll(self, win=False, lose=False):
+        """
+        Shows the squares of the chunks in the store.
+        """
+        changes = []
+        for part in self._showAllSteps(win, lose):
+            changes.extend(part)
+        return changes
+
+    def _showAllSteps(self, win=False, lose=False, step=None):
+        """
+        Generator version of _showAll, which yields the squares changed
+        once there are at least step of them (checked after each row of
+        a chunk), so a loss on a big store is shown over several frames,
+        like a cascade.
+        """
+        size = self._size
+        changes = []
+        for cr, cc in self._chunks.keys():
+            chunk = self._chunks.get((cr, cc))
+            for lr in range(min(size, self._height - cr*size)):
+                for lc in range(min(size, self._width - cc*size)):
+                    i = lr*size + lc
+                    if win and chunk.mines[i]:
+                        chunk.states[i] = 2
+                        chunk.flags[i] = 1
+                        self._n_flagged_squares = self._n_mines
+                        changes.append((cr*size + lr, cc*size + lc))
+                    if lose and chunk.states[i] == 0:
+                        chunk.states[i] = 2
+                        changes.append((cr*size + lr, cc*size + lc))
+                if step and len(changes) >= step:
+                    yield changes
+                    changes = []
+        yield changes
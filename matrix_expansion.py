@@ -1,8 +1,21 @@
 """
 Module that expands a bidimensional matrix and finds the surroundings
 of any position in this matrix.
+Surroundings (neighborhoods) come in two shapes: the ring of squares at
+exactly a given distance, and the disk of every square up to it (the
+distance is the number of king moves, so a disk of order n is a square
+of side 2n+1 without its center).
 """
 
+import sys
+from functools import lru_cache
+from array import array
+
+try:
+    import numpy as np
+except ImportError: #optional, countNeighborhoods has a fallback
+    np = None
+
 def expandMatrix(mat, times=1, e=None):
     """
     Expands the matrix from the outside, as many times as necessary.
@@ -23,47 +36,186 @@ def expandMatrix(mat, times=1, e=None):
     return mat2
 
 
+def ringOffsets(order=1):
+    """
+    Returns the (row, col) offsets of the surroundings of the given order,
+    clockwise from the upper left corner.
+    """
+    if order <= 0: return [(0, 0)]
+
+    ring = []
+    for j in range(-order, order):
+        ring.append((-order, j))
+    for i in range(-order, order):
+        ring.append((i, order))
+    for j in range(order, -order, -1):
+        ring.append((order, j))
+    for i in range(order, -order, -1):
+        ring.append((i, -order))
+
+    return ring
+
+
+def diskOffsets(order=1):
+    """
+    Returns the (row, col) offsets of every surrounding up to the given
+    order, ring by ring from the nearest one.
+    """
+    disk = []
+    for k in range(1, order+1):
+        disk.extend(ringOffsets(k))
+    return disk
+
+
+@lru_cache(maxsize=16)
+def neighborTable(height, width, order=1, shape="ring"):
+    """
+    Precomputes the surroundings of every position of a height x width
+    matrix, flattened row by row (index = row*width + col).
+    shape is "ring" (surroundings at exactly the order) or "disk"
+    (every surrounding up to it).
+    Positions at the same distance from the borders share the same
+    surroundings, so the table has two parts: kinds, with the kind of
+    each index, and offsets, with the flat offsets of each kind.
+    The surroundings of index i are i + d for d in offsets[kinds[i]],
+    in the same order given by findSurroundings.
+    The table is cached for each (height, width, order, shape).
+    """
+    if shape == "ring":
+        ring = ringOffsets(order)
+    elif shape == "disk":
+        ring = diskOffsets(order)
+    else:
+        raise ValueError("unknown shape {!r}".format(shape))
+
+    def rowKinds(length):
+        return [(min(k, order), min(length-1 - k, order))
+                for k in range(length)]
+
+    row_kinds = rowKinds(height)
+    col_kinds = rowKinds(width)
+
+    kind_ids = {}
+    offsets = []
+    for rk in set(row_kinds):
+        for ck in set(col_kinds):
+            kind_ids[rk, ck] = len(offsets)
+            offsets.append(tuple(di*width + dj for di, dj in ring
+                                 if -rk[0] <= di <= rk[1]
+                                 and -ck[0] <= dj <= ck[1]))
+
+    kinds = bytearray() if len(offsets) < 256 else array("I")
+    for rk in row_kinds:
+        kinds.extend([kind_ids[rk, ck] for ck in col_kinds])
+
+    return kinds, tuple(offsets)
+
+
 def findSurroundings(mat, p, order=1, e=None):
     """
     Find the surrounding positions of a certain position in the matrix.
     The surroundings have order 1 by default.
-    In order to do this, expands the matrix as many times as the surroundings
-    order, to avoid problems with positions in the corner of the matrix.
+    The positions come from the neighbor table of the matrix's size, so
+    nothing is copied; positions whose element is e are left out.
     """
-    mat2 = [row[:] for row in mat]
+    return findNeighborhood(mat, p, order, "ring", e)
+
 
+def findNeighborhood(mat, p, order=1, shape="disk", e=None):
+    """
+    Like findSurroundings, but with every surrounding up to the order
+    (shape "disk") or only the ones at the order (shape "ring").
+    """
     if order <= 0: return [p]
 
-    mat2 = expandMatrix(mat2, order, e)
+    width = len(mat[0])
+    kinds, offsets = neighborTable(len(mat), width, order, shape)
+    i = p[0]*width + p[1]
 
-    #goes through the matrix and find the surroundings
     surr = []
+    for d in offsets[kinds[i]]:
+        row, col = divmod(i + d, width)
+        if mat[row][col] is not e:
+            surr.append([row, col])
 
-    start1 = (p[0], p[1])
-    start2 = (start1[0], start1[1] + order*2)
-    start3 = (start2[0] + order*2, start2[1])
-    start4 = (start3[0], start3[1] - order*2)
-
-    for j in range(start1[1], start2[1]):
-        if mat2[start1[0]][j] is not e:
-            surr.append([start1[0], j])
-
-    for i in range(start2[0], start3[0]):
-        if mat2[i][start2[1]] is not e:
-            surr.append([i, start2[1]])
+    return surr
 
-    for j in range(start3[1], start4[1], -1):
-        if mat2[start3[0]][j] is not e:
-            surr.append([start3[0], j])
 
-    for i in range(start4[0], start1[0], -1):
-        if mat2[i][start4[1]] is not e:
-            surr.append([i, start4[1]])
+def countNeighborhoods(plane, height, width, order=1, shape="disk",
+                       backend=None):
+    """
+    Counts, for every position of a flattened height x width matrix, the
+    nonzero elements of plane (one byte per position, 0 or 1) in its
+    surroundings of the given order and shape, all at once.
+    backend is "numpy", "python" or None (numpy when it is installed).
+    Returns the counts flattened row by row: a numpy array with the numpy
+    backend and an array.array otherwise.
+    """
+    if shape not in ("disk", "ring"):
+        raise ValueError("unknown shape {!r}".format(shape))
+    if backend is None:
+        backend = "numpy" if np is not None else "python"
+
+    if backend == "numpy":
+        counts = _numpyDisk(plane, height, width, order)
+        if shape == "ring" and order > 1:
+            counts -= _numpyDisk(plane, height, width, order-1)
+        return counts
+
+    counts = array("H" if (2*order + 1)**2 < 1 << 16 else "I")
+    lane = counts.itemsize
+    sums = _pythonDisk(plane, height, width, order, lane)
+    if shape == "ring" and order > 1:
+        sums -= _pythonDisk(plane, height, width, order-1, lane)
+    counts.frombytes(sums.to_bytes(height*width*lane, "little"))
+    if sys.byteorder == "big":
+        counts.byteswap()
+    return counts
+
+
+def _numpyDisk(plane, height, width, order):
+    """
+    Disk counts from a summed-area table: each count is the sum of a
+    (2*order+1) square, read from four corners of the table, minus the
+    center.
+    """
+    mat = np.frombuffer(bytes(plane), dtype=np.uint8).reshape(height, width)
+    side = 2*order + 1
+    table = np.zeros((height + side, width + side), dtype=np.int32)
+    table[order+1:order+1+height, order+1:order+1+width] = mat
+    table = table.cumsum(axis=0).cumsum(axis=1)
+    box = table[side:, side:] - table[:-side, side:] \
+          - table[side:, :-side] + table[:-side, :-side]
+    return (box - mat).ravel()
 
-    #convert positions so that they are
-    #compatible with the original matrix
-    for pos in surr:
-        pos[0] -= order
-        pos[1] -= order
 
-    return surr
+def _pythonDisk(plane, height, width, order, lane):
+    """
+    Disk counts with no third-party modules, in the way of
+    game.countPlane: the plane is read as a single integer with one lane
+    of the given bytes per position, wide enough to hold any count, so
+    adding shifted copies of it sums every lane at once. The sums over
+    the columns are masked so that they do not wrap between rows.
+    Returns the counts as that integer.
+    """
+    n = height*width
+    bits = 8*lane
+    wide = bytearray(n*lane)
+    wide[0::lane] = plane
+    x = int.from_bytes(wide, "little")
+
+    full = b"\xff"*lane
+    empty = b"\x00"*lane
+    rows = x
+    for d in range(1, min(order, width-1) + 1):
+        #values moving right must not come from the last d columns
+        right = int.from_bytes((full*(width-d) + empty*d) * height, "little")
+        left = int.from_bytes((empty*d + full*(width-d)) * height, "little")
+        rows += ((x & right) << d*bits) + ((x & left) >> d*bits)
+
+    total = rows
+    for d in range(1, min(order, height-1) + 1):
+        total += (rows << d*width*bits) + (rows >> d*width*bits)
+    total &= (1 << n*bits) - 1 #drops what was shifted past the last row
+
+    return total - x
@@ -1,5 +1,7 @@
-from tkinter import Tk, mainloop
+from tkinter import Tk, mainloop, filedialog
 from screens import SetUpScreen, GameScreen
+from game import loadGrid
+from board_file import BoardFile
 
 """
 Minesweeper game implemented in Python 3 using tkinter library.
@@ -27,6 +29,7 @@ class MainWindow:
         ####setup screen
         self.setup_screen = SetUpScreen(self)
         self.setup_screen.but_play["command"] = self.showGameScreen
+        self.setup_screen.but_load["command"] = self.loadGame
 
         ####game screen
         self.game_screen = GameScreen(self)
@@ -52,14 +55,32 @@ class MainWindow:
            and n_m.mini <= int(n_m.ent.get()) <= n_m.maxi):
 
             self.game_screen.setNewGame(int(h.ent.get()), int(w.ent.get()),
-                                        int(n_m.ent.get()))
-
-            self.is_game = True
-            if self.is_setup:
-                self.setup_screen.destroy()
-            self.is_setup = False
+                                        int(n_m.ent.get()),
+                                        self.setup_screen.no_guess.get())
+            self.switchToGame()
+
+    def loadGame(self):
+        path = filedialog.askopenfilename(
+            parent=self.root, filetypes=[("Minesweeper games", "*.msw")])
+        if not path:
+            return
+        try:
+            grid = loadGrid(path, replay=False)
+            with BoardFile(path) as board:
+                moves = list(board.iterMoves())
+        except (OSError, ValueError):
+            return #not a board file
+        self.game_screen.setNewGame(grid.getHeight(), grid.getWidth(),
+                                    grid.getNMines(), grid=grid, moves=moves)
+        self.switchToGame()
+
+    def switchToGame(self):
+        self.is_game = True
+        if self.is_setup:
+            self.setup_screen.destroy()
+        self.is_setup = False
 
-            self.game_screen.show()
+        self.game_screen.show()
 
 ################################################################################
 
@@ -0,0 +1,303 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from random import Random
+from time import perf_counter_ns
+from latency import RollingStats
+from race_server import RaceServer
+
+"""
+Module with a client of race_server and a loopback check: it runs a
+server in the same process, plays races on it with simple bots and
+prints how they went and the round trip of the moves, as JSON. It
+exits with status 1 if a race does not finish or its ranking does not
+match what the bots played, so it can be used as a regression check.
+Usage examples:
+    python race_client.py --races 200 --players 3
+    python race_client.py --unix
+"""
+
+class RaceClient:
+    """
+    Class that talks to a race server over asyncio streams. request
+    sends a request and waits for its reply (matched by its "id"); the
+    broadcasts arrive in the events queue.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.events = asyncio.Queue()
+        self._pending = {} #id: future of the reply
+        self._next_id = 0
+        self._reading = asyncio.ensure_future(self._read())
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=8765):
+        return cls(*await asyncio.open_connection(host, port))
+
+    @classmethod
+    async def connectUnix(cls, path):
+        return cls(*await asyncio.open_unix_connection(path))
+
+    async def _read(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            future = self._pending.pop(message.get("id"), None)
+            if future is not None:
+                future.set_result(message)
+            else:
+                self.events.put_nowait(message)
+        for future in self._pending.values():
+            future.set_exception(ConnectionError("server disconnected"))
+        self._pending.clear()
+
+    async def request(self, op, **fields):
+        """
+        Sends a request and returns its reply.
+        """
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = future
+        fields.update(op=op, id=self._next_id)
+        self.writer.write(json.dumps(fields).encode() + b"\n")
+        await self.writer.drain()
+        return await future
+
+    async def waitFor(self, op):
+        """
+        Returns the next broadcast of that op, skipping the others.
+        """
+        while True:
+            message = await self.events.get()
+            if message["op"] == op:
+                return message
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self._reading.cancel()
+
+
+class Bot:
+    """
+    Player that only sees what the server sends. It chords numbers
+    with all their mines flagged, flags the hidden squares of numbers
+    with as many hidden squares as mines, and otherwise reveals a
+    square at random. Only the numbers around the squares changed since
+    they were last looked at are looked at again.
+    """
+
+    def __init__(self, height, width, rng):
+        self.height = height
+        self.width = width
+        self.rng = rng
+        self.numbers = {} #revealed number, not yet solved: its value
+        self.pending = set() #numbers to look at again
+        self.flagged = set()
+        self.hidden = set((r, c) for r in range(height) for c in range(width))
+
+    def see(self, squares):
+        for row, col, state, flag, value in squares:
+            if state == 0:
+                if flag == "\u2691":
+                    self.flagged.add((row, col))
+                else:
+                    self.flagged.discard((row, col))
+            else:
+                self.hidden.discard((row, col))
+                if value and value.isdigit():
+                    self.numbers[row, col] = int(value)
+                    self.pending.add((row, col))
+            self.pending.update(p for p in self.surroundings(row, col)
+                                if p in self.numbers)
+
+    def surroundings(self, row, col):
+        for r in range(max(0, row-1), min(self.height, row+2)):
+            for c in range(max(0, col-1), min(self.width, col+2)):
+                if (r, c) != (row, col):
+                    yield r, c
+
+    def nextMove(self):
+        """
+        Returns the next move: (kind, row, col).
+        """
+        while self.pending:
+            row, col = self.pending.pop()
+            value = self.numbers[row, col]
+            hidden = [p for p in self.surroundings(row, col)
+                      if p in self.hidden]
+            flags = [p for p in hidden if p in self.flagged]
+            if len(flags) == len(hidden):
+                del self.numbers[row, col] #nothing left around it
+            elif len(flags) == value:
+                return "chord", row, col
+            elif value == len(hidden):
+                r, c = next(p for p in hidden if p not in self.flagged)
+                return "flag", r, c
+        r, c = self.rng.choice(sorted(self.hidden - self.flagged))
+        return "reveal", r, c
+
+
+async def playRace(client, name, race, rng, stats, lobby):
+    """
+    Joins a race and plays it with a Bot, timing the round trip of every
+    move. lobby is a dict with the players expected ("size"), the ones
+    that joined ("joined") and an asyncio.Event ("full"); the first
+    player starts the race once everybody joined. Returns what the bot
+    played ("player", "moves", "result") and the race's "ranking".
+    """
+    joined = await client.request("join", game=race["game"], name=name)
+    if joined["op"] == "error":
+        raise RuntimeError(joined["error"])
+    lobby["joined"] += 1
+    if lobby["joined"] == lobby["size"]:
+        lobby["full"].set()
+    if name == "player1":
+        await lobby["full"].wait()
+        await client.request("start")
+    go = await client.waitFor("go")
+
+    bot = Bot(race["height"], race["width"], rng)
+    bot.see(go["squares"])
+    result = None
+    n_moves = 0
+    while result is None:
+        kind, row, col = bot.nextMove()
+        start = perf_counter_ns()
+        moved = await client.request("move", kind=kind, row=row, col=col)
+        stats.add(perf_counter_ns() - start)
+        if moved["op"] == "error":
+            raise RuntimeError(moved["error"])
+        n_moves += 1
+        bot.see(moved["squares"])
+        result = moved["result"]
+    ranking = (await client.waitFor("results"))["ranking"]
+    return {"player": name, "moves": n_moves, "result": result,
+            "ranking": ranking}
+
+
+def checkRace(plays):
+    """
+    Returns the problems of a race's results, given what each of its
+    players returned from playRace (or the exception it raised): every
+    player must get the same ranking, with their own moves and result,
+    and the winners first, fastest first.
+    """
+    errors = [repr(p) for p in plays if isinstance(p, BaseException)]
+    if errors:
+        return errors
+    ranking = plays[0]["ranking"]
+    if any(p["ranking"] != ranking for p in plays):
+        errors.append("players got different rankings")
+    played = {p["player"]: (p["moves"], p["result"]) for p in plays}
+    ranked = {p["player"]: (p["moves"], p["result"]) for p in ranking}
+    if played != ranked:
+        errors.append("ranking {} does not match the moves played {}"
+                      .format(ranked, played))
+    n_won = sum(1 for p in ranking if p["result"] == "won")
+    if any(p["result"] == "won" for p in ranking[n_won:]) \
+       or [p["ms"] for p in ranking[:n_won]] \
+          != sorted(p["ms"] for p in ranking[:n_won]):
+        errors.append("winners out of order in {}".format(ranking))
+    return errors
+
+
+async def loopback(n_races=100, n_players=3, height=16, width=30,
+                   n_mines=99, seed=0, unix=False, timeout=300):
+    """
+    Runs a race server in this process and plays n_races races on it at
+    once, each one with n_players bots on their own connection.
+    Returns a summary of the races and of the moves' round trip, with
+    the problems found by checkRace (or a timeout) in "errors".
+    """
+    server = RaceServer()
+    if unix:
+        path = os.path.join(tempfile.mkdtemp(), "races.sock")
+        listener = await server.serveUnix(path)
+        connect = lambda: RaceClient.connectUnix(path)
+    else:
+        listener = await server.serveTCP("127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        connect = lambda: RaceClient.connect("127.0.0.1", port)
+
+    stats = RollingStats(size=100000)
+    rng = Random(seed)
+    clients = []
+    plays = []
+    begin = perf_counter_ns()
+    async with listener:
+        for k in range(n_races):
+            clients.append(await connect())
+            race = await clients[-1].request(
+                "create", height=height, width=width, n_mines=n_mines,
+                seed="{}:{}".format(seed, k))
+            lobby = {"size": n_players, "joined": 0,
+                     "full": asyncio.Event()}
+            for p in range(n_players):
+                if p > 0:
+                    clients.append(await connect())
+                plays.append(playRace(clients[-1], "player{}".format(p+1),
+                                      race, Random(rng.random()), stats,
+                                      lobby))
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(*plays, return_exceptions=True), timeout)
+        except asyncio.TimeoutError:
+            results = None
+        spent = perf_counter_ns() - begin
+        for client in clients:
+            await client.close()
+
+    won = 0
+    errors = []
+    if results is None:
+        errors.append("the races did not finish in {} s".format(timeout))
+    else:
+        for k in range(0, len(results), n_players):
+            race = results[k:k+n_players]
+            errors.extend("race {}: {}".format(k // n_players + 1, e)
+                          for e in checkRace(race))
+            if not isinstance(race[0], BaseException):
+                won += sum(1 for p in race[0]["ranking"]
+                           if p["result"] == "won")
+    summary = stats.getSummary()
+    return {"races": n_races, "players": n_players, "won": won,
+            "errors": errors,
+            "moves": stats.count, "seconds": spent / 1e9,
+            "moves_per_s": stats.count / (spent / 1e9),
+            "rtt_us": {p: (summary[p] or 0) / 1000
+                       for p in ("p50", "p95", "p99")}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Plays races with bots on a race server run in this "
+                    "process and prints the moves' round trip, as JSON.")
+    parser.add_argument("--races", type=int, default=100)
+    parser.add_argument("--players", type=int, default=3)
+    parser.add_argument("--size", type=int, nargs=2, default=(16, 30),
+                        metavar=("HEIGHT", "WIDTH"))
+    parser.add_argument("--mines", type=int, default=99)
+    parser.add_argument("--seed", default="0")
+    parser.add_argument("--unix", action="store_true",
+                        help="uses a Unix socket instead of TCP")
+    parser.add_argument("--timeout", type=float, default=300,
+                        help="seconds for all the races to finish")
+    args = parser.parse_args(argv)
+    summary = asyncio.run(loopback(args.races, args.players, *args.size,
+                                   args.mines, args.seed, args.unix,
+                                   args.timeout))
+    sys.stdout.write(json.dumps(summary) + "\n")
+    if summary["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+import argparse
+import asyncio
+import json
+import random
+from itertools import count
+from time import monotonic_ns
+from game import Grid
+from board_file import KINDS
+
+"""
+Module with a server for races: several players play the same seeded
+board at once, each one on their own copy, and the first to clear it
+wins. The clients talk to it over TCP or a Unix socket, one JSON object
+per line. The moves are played by the engine, so the server decides
+what is legal and what each move revealed.
+
+Requests (a client may add an "id", copied in the reply to it):
+    {"op": "create", "height": 16, "width": 30, "n_mines": 99,
+     "seed": 7 (optional)}
+    {"op": "join", "game": 1, "name": "ana"}
+    {"op": "start"}                                 (one of the players)
+    {"op": "move", "kind": "reveal", "row": 8, "col": 15}
+    {"op": "leave"}
+Replies: "created", "joined", "started", "moved", "left" or "error".
+Broadcast to the players of a game: "player" (someone joined or left),
+"go" (the race started, from the square every player reveals first),
+"progress", "finished" (a player won, lost or left) and "results"
+(ranking, once everybody finished).
+Usage example:
+    python race_server.py --port 8765
+"""
+
+#the moves run in the event loop: the cascades of bigger boards would
+#hold up the other races
+MAX_CELLS = 300*300
+MAX_LINE = 64*1024
+MAX_RACES = 1000 #races open at once
+JOIN_TIMEOUT = 60 #seconds a race may wait for its first player
+
+class RaceError(Exception):
+    """
+    Request that the server refuses; its message goes to the client.
+    """
+    pass
+
+
+class Player:
+    """
+    Player of a race, with their own copy of the board.
+    """
+
+    def __init__(self, name, writer, grid):
+        self.name = name
+        self.writer = writer
+        self.grid = grid
+        self.n_moves = 0
+        self.result = None #"won", "lost" or "left"
+        self.ms = None #time when they finished, since the race started
+
+    def getSummary(self):
+        return {"player": self.name, "result": self.result,
+                "progress": self.grid.getProgress(), "moves": self.n_moves,
+                "ms": self.ms}
+
+
+class Race:
+    """
+    Class holding a race: the board's mines, placed from a seed around
+    the center square, and the players. Every player gets a Grid with
+    the same mines; the race starts by revealing the center for all of
+    them, so nobody's first click decides the board.
+    """
+
+    def __init__(self, race_id, height, width, n_mines, seed):
+        self.id = race_id
+        self.height = height
+        self.width = width
+        self.n_mines = n_mines
+        self.seed = seed
+        self.start = (height // 2, width // 2)
+
+        board = Grid(height, width, n_mines)
+        board.setMines(*self.start, seed)
+        mines = board.getMines()
+        self.mines = [i for i in range(height*width) if mines[i]]
+
+        self.players = {} #name: Player
+        self.started = None #monotonic_ns when the race started
+
+    def getInfo(self):
+        return {"game": self.id, "height": self.height, "width": self.width,
+                "n_mines": self.n_mines, "seed": self.seed,
+                "players": list(self.players)}
+
+    def addPlayer(self, name, writer):
+        if self.started is not None:
+            raise RaceError("the race already started")
+        if name in self.players:
+            raise RaceError("name {!r} already taken".format(name))
+        grid = Grid(self.height, self.width, self.n_mines)
+        grid.placeMines(self.mines)
+        player = Player(name, writer, grid)
+        self.players[name] = player
+        return player
+
+    def begin(self):
+        """
+        Starts the race, revealing the center square of every board.
+        Returns the squares it revealed (the same on every board).
+        """
+        if self.started is not None:
+            raise RaceError("the race already started")
+        self.started = monotonic_ns()
+        for player in self.players.values():
+            changes = player.grid.reveal(*self.start)
+        return changes
+
+    def play(self, player, kind, row, col):
+        """
+        Plays a player's move. Returns the squares it changed.
+        """
+        if self.started is None:
+            raise RaceError("the race did not start")
+        if player.result is not None:
+            raise RaceError("you already finished")
+        if kind not in KINDS:
+            raise RaceError("unknown move {!r}".format(kind))
+        if not (isinstance(row, int) and isinstance(col, int)
+                and 0 <= row < self.height and 0 <= col < self.width):
+            raise RaceError("no square at ({!r}, {!r})".format(row, col))
+
+        changes = player.grid.move(kind, row, col)
+        player.n_moves += 1
+        if player.grid.isLost():
+            self.finish(player, "lost")
+        elif player.grid.hadVictory():
+            self.finish(player, "won")
+        return changes
+
+    def finish(self, player, result):
+        player.result = result
+        player.ms = (monotonic_ns() - self.started) // 1000000 \
+                    if self.started is not None else None
+
+    def isOver(self):
+        return all(p.result is not None for p in self.players.values())
+
+    def getRanking(self):
+        """
+        Returns the players' summaries: the winners by time, then the
+        others by progress.
+        """
+        players = sorted(self.players.values(),
+                         key=lambda p: (p.result != "won",
+                                        p.ms if p.result == "won"
+                                        else -p.grid.getProgress()))
+        return [p.getSummary() for p in players]
+
+
+def squaresOf(grid, changes):
+    """
+    Returns the changed squares as the clients see them: [row, col,
+    state, flag, value], with the value only for revealed squares.
+    """
+    squares = []
+    for row, col in changes:
+        sq = grid.getSquare(row, col)
+        value = sq.getValue() if sq.getState() != 0 else None
+        squares.append([row, col, sq.getState(), sq.getFlag(), value])
+    return squares
+
+
+class RaceServer:
+    """
+    Class that serves races over asyncio streams. Every connection is
+    one client, which can create races and play in one at a time.
+    The moves are cheap next to the network (the boards are limited to
+    MAX_CELLS squares), so they run in the event loop, and a process
+    holds hundreds of races. Broadcasts are written without waiting for
+    each client to drain, so a slow client does not delay the others.
+    At most max_races races are open at once, and a race nobody joins
+    within join_timeout seconds is dropped.
+    """
+
+    def __init__(self, max_cells=MAX_CELLS, max_races=MAX_RACES,
+                 join_timeout=JOIN_TIMEOUT):
+        self.max_cells = max_cells
+        self.max_races = max_races
+        self.join_timeout = join_timeout
+        self.races = {} #id: Race
+        self._ids = count(1)
+        self.n_moves = 0
+
+    async def serveTCP(self, host="127.0.0.1", port=8765):
+        return await asyncio.start_server(self.handle, host, port,
+                                          limit=MAX_LINE)
+
+    async def serveUnix(self, path):
+        return await asyncio.start_unix_server(self.handle, path,
+                                               limit=MAX_LINE)
+
+    def send(self, writer, message):
+        if not writer.is_closing():
+            writer.write(json.dumps(message).encode() + b"\n")
+
+    def broadcast(self, race, message):
+        for player in race.players.values():
+            if player.result != "left":
+                self.send(player.writer, message)
+
+    async def handle(self, reader, writer):
+        """
+        Serves a client until it disconnects.
+        """
+        client = {"race": None, "player": None}
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    break #line too long or connection lost
+                if not line:
+                    break
+                reply = self.request(client, writer, line)
+                self.send(writer, reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.leave(client)
+            writer.close()
+
+    def request(self, client, writer, line):
+        """
+        Answers a request line. Returns the reply.
+        """
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return {"op": "error", "error": "invalid JSON"}
+
+        message_id = None
+        try:
+            if not isinstance(message, dict):
+                raise RaceError("requests must be JSON objects")
+            message_id = message.get("id")
+            op = message.get("op")
+            handlers = {"create": self.create, "join": self.join,
+                        "start": self.begin, "move": self.move,
+                        "leave": self.leave}
+            if op not in handlers:
+                raise RaceError("unknown op {!r}".format(op))
+            reply = handlers[op](client, message, writer)
+        except RaceError as e:
+            reply = {"op": "error", "error": str(e)}
+        except Exception as e: #a request nobody thought of
+            reply = {"op": "error",
+                     "error": "bad request ({})".format(type(e).__name__)}
+        if message_id is not None:
+            reply["id"] = message_id
+        return reply
+
+    def create(self, client, message, writer):
+        try:
+            height = int(message["height"])
+            width = int(message["width"])
+            n_mines = int(message["n_mines"])
+        except (KeyError, TypeError, ValueError, OverflowError):
+            raise RaceError("create needs height, width and n_mines")
+        if not (4 <= height and 4 <= width
+                and height*width <= self.max_cells):
+            raise RaceError("boards go from 4x4 to {} squares".format(
+                self.max_cells))
+        if not 1 <= n_mines <= height*width - 9:
+            raise RaceError("too many or too few mines")
+        if len(self.races) >= self.max_races:
+            raise RaceError("too many races, try again later")
+        seed = message.get("seed")
+        if seed is None:
+            seed = random.getrandbits(63)
+        elif not isinstance(seed, (int, str)):
+            raise RaceError("seeds are integers or strings")
+
+        race = Race(next(self._ids), height, width, n_mines, seed)
+        self.races[race.id] = race
+        asyncio.get_running_loop().call_later(self.join_timeout,
+                                              self._dropIfEmpty, race.id)
+        return dict(race.getInfo(), op="created")
+
+    def _dropIfEmpty(self, race_id):
+        """
+        Drops a race that nobody joined, or that everybody left.
+        """
+        race = self.races.get(race_id)
+        if race is not None and not race.players:
+            del self.races[race_id]
+
+    def join(self, client, message, writer):
+        if client["race"] is not None:
+            raise RaceError("you are already in a race")
+        race_id = message.get("game")
+        if not isinstance(race_id, int):
+            raise RaceError("game must be a race's number")
+        race = self.races.get(race_id)
+        if race is None:
+            raise RaceError("no race {!r}".format(message.get("game")))
+        name = str(message.get("name") or "player{}".format(
+            len(race.players) + 1))
+
+        client["player"] = race.addPlayer(name, writer)
+        client["race"] = race
+        self.broadcast(race, {"op": "player", "game": race.id,
+                              "player": name, "joined": True})
+        return dict(race.getInfo(), op="joined", player=name)
+
+    def begin(self, client, message, writer):
+        race = self._getRace(client)
+        changes = race.begin()
+        grid = client["player"].grid
+        self.broadcast(race, {"op": "go", "game": race.id,
+                              "start": list(race.start),
+                              "squares": squaresOf(grid, changes)})
+        return {"op": "started", "game": race.id}
+
+    def move(self, client, message, writer):
+        race = self._getRace(client)
+        player = client["player"]
+        kind = message.get("kind")
+        row = message.get("row")
+        col = message.get("col")
+        if not isinstance(kind, str):
+            raise RaceError("kind must be one of {}".format(", ".join(KINDS)))
+        changes = race.play(player, kind, row, col)
+        self.n_moves += 1
+
+        if changes:
+            self.broadcast(race, {"op": "progress", "game": race.id,
+                                  "player": player.name,
+                                  "progress": player.grid.getProgress()})
+        if player.result is not None:
+            self.broadcast(race, dict(player.getSummary(), op="finished",
+                                      game=race.id))
+            self._checkOver(race)
+        return {"op": "moved", "kind": kind, "row": row, "col": col,
+                "squares": squaresOf(player.grid, changes),
+                "progress": player.grid.getProgress(),
+                "result": player.result}
+
+    def leave(self, client, message=None, writer=None):
+        """
+        Takes the client out of its race; a player leaving an unfinished
+        race finishes it as "left".
+        """
+        race = client["race"]
+        player = client["player"]
+        client["race"] = client["player"] = None
+        if race is None:
+            if message is not None:
+                raise RaceError("you are not in a race")
+            return None
+
+        if race.started is None:
+            del race.players[player.name]
+            self.broadcast(race, {"op": "player", "game": race.id,
+                                  "player": player.name, "joined": False})
+        elif player.result is None:
+            race.finish(player, "left")
+            self.broadcast(race, dict(player.getSummary(), op="finished",
+                                      game=race.id))
+            self._checkOver(race)
+        if not race.players:
+            self.races.pop(race.id, None)
+        return {"op": "left", "game": race.id}
+
+    def _getRace(self, client):
+        if client["race"] is None:
+            raise RaceError("join a race first")
+        return client["race"]
+
+    def _checkOver(self, race):
+        if race.isOver():
+            self.broadcast(race, {"op": "results", "game": race.id,
+                                  "ranking": race.getRanking()})
+            self.races.pop(race.id, None)
+
+
+async def serve(host, port, path):
+    server = RaceServer()
+    if path:
+        listener = await server.serveUnix(path)
+    else:
+        listener = await server.serveTCP(host, port)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serves Minesweeper races, as JSON lines over TCP or "
+                    "a Unix socket.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH",
+                        help="listens on a Unix socket instead of TCP")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
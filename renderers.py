@@ -0,0 +1,388 @@
+import tkinter as tk
+from time import perf_counter_ns
+
+"""
+Module that draws the game's grid on the screen.
+The renderers subscribe to the grid and only mark the changed squares
+as dirty; the dirty squares are drawn together once tkinter is idle,
+so a whole move (or the end of the game) costs a single redraw.
+"""
+
+## colors:
+## blue = #cfe2f3 < #9fc5e8 < #6fa8dc
+## red = #c67474 < #c63d3d
+##
+## \u2620 = skull and bones
+## \u2691 = flag
+
+#look of every square when the game starts
+BLANK_LOOK = ("normal", "#6fa8dc", "black", " ")
+
+def squareLook(grid, row, col):
+    """
+    Returns how a square must look: (state, bg, fg, text).
+    """
+    sq = grid.getSquare(row, col)
+    if sq.getState() == 0: #hidden
+        return ("normal", "#6fa8dc", "black",
+                sq.getFlag() if sq.getFlag() else " ")
+    elif sq.getState() == 1: #revealed
+        return ("disabled", "#cfe2f3", "black", sq.getValue())
+    else: #shown at the game's end
+        is_mine = sq.getValue() == "\u2620"
+        text = sq.getValue() if is_mine else " "
+        fg = "black"
+        if sq.getFlag() == "\u2691":
+            text = "\u2691"
+            if not is_mine:
+                fg = "red"
+        if grid.getExploded() == (row, col):
+            fg = "red"
+        return ("disabled", "#6fa8dc", fg, text)
+
+
+class Renderer:
+    """
+    Abstract class. Keeps the dirty squares of a grid and draws them
+    all at once when tkinter is idle. Squares whose look did not change
+    since they were last drawn are skipped.
+    Defines an abstract method (drawSquare).
+    """
+
+    def __init__(self, master, grid):
+        self.master = master
+        self.grid = grid
+        self._dirty = set()
+        self._id_flush = None
+        self._drawn = {} #(row, col): last look drawn, if not BLANK_LOOK
+        self._highlighted = set()
+        self.on_flush = None #called with the nanoseconds of every flush
+
+        grid.subscribe(self.markDirty)
+
+    def markDirty(self, changes):
+        """
+        Listener of the grid. Schedules a flush for the next idle time,
+        if there is none yet.
+        """
+        self._dirty.update(changes)
+        if self._id_flush is None:
+            self._id_flush = self.master.after_idle(self._idleFlush)
+
+    def isFlushPending(self):
+        """
+        Returns True if a flush is scheduled for the next idle time.
+        """
+        return self._id_flush is not None
+
+    def _idleFlush(self):
+        start = perf_counter_ns()
+        self.flush()
+        if self.on_flush is not None:
+            self.on_flush(perf_counter_ns() - start)
+
+    def _takeDirty(self):
+        """
+        Returns the squares to draw in a flush: the dirty ones and the
+        highlighted ones, which go back to their normal look.
+        """
+        self._id_flush = None
+        dirty = self._dirty | self._highlighted
+        self._dirty = set()
+        self._highlighted = set()
+        return dirty
+
+    def flush(self):
+        for row, col in self._takeDirty():
+            look = squareLook(self.grid, row, col)
+            if self._drawn.get((row, col), BLANK_LOOK) != look:
+                self._drawn[row, col] = look
+                self.drawSquare(row, col, look)
+
+    def drawSquare(self, row, col, look):
+        pass
+
+    def highlight(self, row, col, bg):
+        """
+        Draws a square with another background until the next flush,
+        to point it out to the player.
+        """
+        look = squareLook(self.grid, row, col)
+        look = look[:1] + (bg,) + look[2:]
+        self._drawn[row, col] = look
+        self._highlighted.add((row, col))
+        self.drawSquare(row, col, look)
+
+    def bind(self, sequence, func):
+        pass
+
+    def getPosition(self, event):
+        """
+        Returns the (row, col) of the square where the event happened,
+        or None if it happened outside the grid.
+        """
+        pass
+
+    def destroy(self):
+        if self._id_flush is not None:
+            self.master.after_cancel(self._id_flush)
+            self._id_flush = None
+        self.grid.unsubscribe(self.markDirty)
+
+
+class ButtonRenderer(Renderer):
+    """
+    Draws every square as a tkinter Button, placed with grid inside
+    the master frame.
+    The buttons share a bind tag, so an event is bound once for all of
+    them, and the square of a button is found in a dict.
+    """
+
+    def __init__(self, master, grid, fsize, padleft=0):
+        super().__init__(master, grid)
+
+        self.tag = "Board{}".format(id(self))
+        self.positions = {} #button: (row, col)
+        self.sequences = []
+        self.buttons = []
+        for r in range(grid.getHeight()):
+            self.buttons.append([])
+            for c in range(grid.getWidth()):
+                b = tk.Button(self.master,
+                              width=2, height=1,
+                              font=("Ubuntu Mono", fsize),
+                              fg="black", text=" ", activeforeground="black",
+                              bg="#6fa8dc", activebackground="#9fc5e8",
+                              highlightbackground="black",
+                              highlightthickness=2,
+                              state="normal")
+                padx = (0, 0)
+                pady = (0, 0)
+                if r == 0:
+                    pady = (20, 0)
+                elif r == grid.getHeight()-1:
+                    pady = (0, 20)
+                if c == 0:
+                    padx = (20+padleft, 0)
+                elif c == grid.getWidth()-1:
+                    padx = (0, 20)
+                b.grid(row=r, column=c,
+                       padx=padx, pady=pady)
+                b.bindtags((self.tag,) + b.bindtags())
+                self.positions[b] = (r, c)
+                self.buttons[r].append(b)
+
+    def bind(self, sequence, func):
+        self.master.bind_class(self.tag, sequence, func)
+        self.sequences.append(sequence)
+
+    def getPosition(self, event):
+        return self.positions.get(event.widget)
+
+    def drawSquare(self, row, col, look):
+        state, bg, fg, text = look
+        self.buttons[row][col].config(state=state, bg=bg,
+                                      disabledforeground=fg, text=text)
+
+    def destroy(self):
+        super().destroy()
+        for sequence in self.sequences:
+            self.master.unbind_class(self.tag, sequence)
+        for r in self.buttons:
+            for b in r:
+                b.grid_forget()
+
+
+class CanvasRenderer(Renderer):
+    """
+    Draws the grid on a single tkinter Canvas that works as a viewport:
+    only the squares in sight have items (a rectangle and a text each),
+    and these items are reused as the board scrolls or zooms.
+    Changes to squares out of sight are not drawn; those squares are
+    drawn from the grid's state once they come into view. So the cost
+    depends on the window's size, not on the board's.
+    Events are bound once, to the canvas, and mapped to squares by their
+    coordinates. The mouse wheel scrolls (sideways with Shift) and
+    zooms (with Control).
+    """
+
+    MIN_SIZE = 8
+    MAX_SIZE = 48
+
+    def __init__(self, master, grid, max_width, max_height):
+        super().__init__(master, grid)
+        self.max_width = int(max_width) - 20 #room for the scrollbars
+        self.max_height = int(max_height) - 20
+        self.top = 0 #first row in sight
+        self.left = 0 #first column in sight
+        self._redraw = False
+
+        self.canvas = tk.Canvas(self.master,
+                                bg=self.master["bg"],
+                                highlightthickness=0)
+        self.vbar = tk.Scrollbar(self.master, orient="vertical",
+                                 command=self.yview)
+        self.hbar = tk.Scrollbar(self.master, orient="horizontal",
+                                 command=self.xview)
+        self.canvas.grid(row=0, column=0, padx=(20, 0), pady=(20, 0))
+        self.vbar.grid(row=0, column=1, sticky="ns", pady=(20, 0))
+        self.hbar.grid(row=1, column=0, sticky="ew", padx=(20, 0))
+
+        for sequence in ["<MouseWheel>", "<Button-4>", "<Button-5>"]:
+            self.canvas.bind(sequence, self.wheel)
+
+        self.setSize(int(min(self.max_width / grid.getWidth(),
+                             self.max_height / grid.getHeight())))
+
+    def setSize(self, size):
+        """
+        Sets the side of the squares in pixels (the zoom) and rebuilds
+        the items for the squares in sight.
+        """
+        self.size = max(self.MIN_SIZE, min(self.MAX_SIZE, size))
+        self.font = ("Ubuntu Mono", -max(3, int(self.size * 0.7)), "bold")
+
+        width = min(self.grid.getWidth()*self.size, self.max_width)
+        height = min(self.grid.getHeight()*self.size, self.max_height)
+        self.canvas.config(width=width, height=height)
+        self.rows = min(self.grid.getHeight(), -(-height // self.size))
+        self.cols = min(self.grid.getWidth(), -(-width // self.size))
+
+        self.canvas.delete("all")
+        self.rects = []
+        self.texts = []
+        self.looks = [] #look drawn in each item
+        for vr in range(self.rows):
+            y = vr*self.size
+            for vc in range(self.cols):
+                x = vc*self.size
+                self.rects.append(self.canvas.create_rectangle(
+                    x, y, x+self.size, y+self.size,
+                    fill=BLANK_LOOK[1], outline="black"))
+                self.texts.append(self.canvas.create_text(
+                    x + self.size/2, y + self.size/2,
+                    text=" ", fill="black", font=self.font))
+                self.looks.append(BLANK_LOOK)
+        self._moveView(self.top, self.left)
+
+    def _moveView(self, top, left):
+        self.top = max(0, min(top, self.grid.getHeight() - self.rows))
+        self.left = max(0, min(left, self.grid.getWidth() - self.cols))
+        self.redraw()
+
+    def redraw(self):
+        """
+        Draws every square in sight from the grid's state.
+        """
+        self._redraw = False
+        self._dirty = set()
+        for vr in range(self.rows):
+            for vc in range(self.cols):
+                row = self.top + vr
+                col = self.left + vc
+                self.drawSquare(row, col, squareLook(self.grid, row, col))
+
+        height = self.grid.getHeight()
+        width = self.grid.getWidth()
+        self.vbar.set(self.top / height, (self.top + self.rows) / height)
+        self.hbar.set(self.left / width, (self.left + self.cols) / width)
+
+    def _scrolled(self, args, first, shown, total):
+        """
+        Returns the first row (or column) in sight after a scrollbar
+        command: ("moveto", fraction) or ("scroll", n, "units"/"pages").
+        """
+        if args[0] == "moveto":
+            return int(float(args[1]) * total)
+        if args[2] == "pages":
+            return first + int(args[1])*shown
+        return first + int(args[1])
+
+    def yview(self, *args):
+        self._moveView(self._scrolled(args, self.top, self.rows,
+                                      self.grid.getHeight()), self.left)
+
+    def xview(self, *args):
+        self._moveView(self.top, self._scrolled(args, self.left, self.cols,
+                                                self.grid.getWidth()))
+
+    def wheel(self, event):
+        step = -1 if event.num == 4 or event.delta > 0 else 1
+        if event.state & 0x4: #Control
+            self.zoom(-step, event.x, event.y)
+        elif event.state & 0x1: #Shift
+            self.xview("scroll", step*3, "units")
+        else:
+            self.yview("scroll", step*3, "units")
+
+    def zoom(self, direction, x=0, y=0):
+        """
+        Makes the squares bigger (direction > 0) or smaller, keeping the
+        square under (x, y) in place.
+        """
+        size = max(self.MIN_SIZE,
+                   min(self.MAX_SIZE,
+                       self.size + direction*max(1, self.size // 4)))
+        if size != self.size:
+            self.top += y // self.size - y // size
+            self.left += x // self.size - x // size
+            self.setSize(size)
+
+    def markDirty(self, changes):
+        if len(changes) > len(self.rects):
+            #cheaper to draw everything in sight
+            self._redraw = True
+            changes = []
+        else:
+            changes = [(r, c) for r, c in changes
+                       if self.top <= r < self.top + self.rows
+                       and self.left <= c < self.left + self.cols]
+        if changes or self._redraw:
+            super().markDirty(changes)
+
+    def flush(self):
+        dirty = self._takeDirty()
+        if self._redraw:
+            self.redraw()
+        else:
+            for row, col in dirty:
+                self.drawSquare(row, col, squareLook(self.grid, row, col))
+
+    def highlight(self, row, col, bg):
+        if not (self.top <= row < self.top + self.rows
+                and self.left <= col < self.left + self.cols):
+            self._moveView(row - self.rows // 2, col - self.cols // 2)
+        super().highlight(row, col, bg)
+
+    def bind(self, sequence, func):
+        self.canvas.bind(sequence, func)
+
+    def getPosition(self, event):
+        row = self.top + event.y // self.size
+        col = self.left + event.x // self.size
+        if 0 <= event.y and 0 <= event.x \
+           and row < min(self.top + self.rows, self.grid.getHeight()) \
+           and col < min(self.left + self.cols, self.grid.getWidth()):
+            return row, col
+        return None
+
+    def drawSquare(self, row, col, look):
+        vr = row - self.top
+        vc = col - self.left
+        if not (0 <= vr < self.rows and 0 <= vc < self.cols):
+            return #out of sight, drawn when it comes into view
+        i = vr*self.cols + vc
+        if self.looks[i] == look:
+            return
+        state, bg, fg, text = look
+        if self.looks[i][1] != bg:
+            self.canvas.itemconfig(self.rects[i], fill=bg)
+        if self.looks[i][2:] != (fg, text):
+            self.canvas.itemconfig(self.texts[i], text=text, fill=fg)
+        self.looks[i] = look
+
+    def destroy(self):
+        super().destroy()
+        self.canvas.destroy()
+        self.vbar.destroy()
+        self.hbar.destroy()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import sys
+from time import monotonic_ns, perf_counter_ns
+from game import loadGrid
+from board_file import BoardFile
+
+"""
+Module that records the moves of a game and plays them again, either
+without the GUI as fast as possible (to check the engine's results and
+speed on many recorded games) or in the GUI at 1x to 100x the speed
+they were played.
+Usage example:
+    python replay.py games/*.msw
+"""
+
+class MoveRecorder:
+    """
+    Class that records the moves of a game as (kind, row, col,
+    milliseconds since the first move), measured with a monotonic clock.
+    The kinds are "reveal", "flag" and "chord", as in Grid.move.
+    A recorder may start from the moves of a loaded game; the new moves
+    are then timed from the last of them.
+    """
+
+    def __init__(self, moves=()):
+        self._moves = list(moves)
+        self._start = None #clock's value at the time 0 of the moves
+
+    def record(self, kind, row, col, now=None):
+        """
+        Records a move made at now (monotonic_ns), by default now.
+        """
+        if now is None:
+            now = monotonic_ns()
+        if self._start is None:
+            last = self._moves[-1][3] if self._moves else 0
+            self._start = now - last*1000000
+        self._moves.append((kind, row, col, (now - self._start) // 1000000))
+
+    def getMoves(self):
+        return list(self._moves)
+
+
+def replayMoves(grid, moves):
+    """
+    Plays the moves on a grid with its mines placed, as fast as possible,
+    until they run out or the game is over.
+    Returns a dict with the outcome and the time spent in the moves.
+    """
+    n_moves = 0
+    spent = 0
+    for kind, row, col, time in moves:
+        if grid.isLost() or grid.hadVictory():
+            break
+        start = perf_counter_ns()
+        grid.move(kind, row, col)
+        spent += perf_counter_ns() - start
+        n_moves += 1
+    return {"moves": n_moves, "won": grid.hadVictory(), "lost": grid.isLost(),
+            "progress": grid.getProgress(), "move_ns": spent}
+
+
+def replayFile(path):
+    """
+    Replays a board file without the GUI. See replayMoves.
+    """
+    grid = loadGrid(path, replay=False)
+    with BoardFile(path) as board:
+        result = replayMoves(grid, board.iterMoves())
+    result["path"] = path
+    return result
+
+
+class Replayer:
+    """
+    Class that replays moves on a grid in the GUI, keeping the time
+    between them divided by the speed (1 to 100). The moves are
+    scheduled with the widget's after, so the GUI keeps responding;
+    on_move is called after every move and on_end once they are over.
+    """
+
+    MIN_SPEED = 1
+    MAX_SPEED = 100
+
+    def __init__(self, widget, grid, moves, speed=1, on_move=None,
+                 on_end=None):
+        self.widget = widget
+        self.grid = grid
+        self.moves = list(moves)
+        self.on_move = on_move
+        self.on_end = on_end
+        self.next = 0 #next move to play
+        self._id_step = None
+        self.setSpeed(speed)
+
+    def getSpeed(self):
+        return self.speed
+
+    def setSpeed(self, speed):
+        self.speed = max(self.MIN_SPEED, min(self.MAX_SPEED, speed))
+
+    def start(self):
+        if self.next < len(self.moves):
+            self._id_step = self.widget.after_idle(self._step)
+        elif self.on_end is not None:
+            self.on_end()
+
+    def _step(self):
+        self._id_step = None
+        kind, row, col, time = self.moves[self.next]
+        self.grid.move(kind, row, col)
+        self.next += 1
+        if self.on_move is not None:
+            self.on_move(kind, row, col)
+
+        if self.next == len(self.moves) \
+           or self.grid.isLost() or self.grid.hadVictory():
+            if self.on_end is not None:
+                self.on_end()
+            return
+        delay = (self.moves[self.next][3] - time) / self.speed
+        self._id_step = self.widget.after(int(delay), self._step)
+
+    def stop(self):
+        if self._id_step is not None:
+            self.widget.after_cancel(self._id_step)
+            self._id_step = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replays board files without the GUI and prints the "
+                    "outcome of each one, as JSON lines.")
+    parser.add_argument("paths", nargs="+", help="board files (.msw)")
+    parser.add_argument("--output", type=argparse.FileType("w"),
+                        default=sys.stdout)
+    args = parser.parse_args(argv)
+
+    n_moves = 0
+    spent = 0
+    for path in args.paths:
+        try:
+            result = replayFile(path)
+        except (OSError, ValueError) as e:
+            args.output.write(json.dumps({"path": path,
+                                          "error": str(e)}) + "\n")
+            continue
+        n_moves += result["moves"]
+        spent += result["move_ns"]
+        args.output.write(json.dumps(result) + "\n")
+    args.output.write(json.dumps({"files": len(args.paths),
+                                  "moves": n_moves,
+                                  "move_us": spent / max(1, n_moves) / 1000})
+                      + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,14 @@
-from time import monotonic
+from time import monotonic, monotonic_ns, perf_counter_ns
+from collections import deque
 import tkinter as tk
+from tkinter import filedialog, messagebox
 from game import Grid
+from lazy_grid import LazyGrid, LAZY_CELLS, MIN_DENSITY
+from renderers import ButtonRenderer, CanvasRenderer
+from solver import Solver
+from board_pool import BoardPool
+from replay import MoveRecorder, Replayer
+from latency import LatencyMonitor
 
 ## colors:
 ## blue = #cfe2f3 < #9fc5e8 < #6fa8dc
@@ -11,9 +19,17 @@ from game import Grid
 ## \u2620 = skull and bones
 ## \u2691 = flags
 ## \u231a = clock (\u23f1, \u231b, \u29d6, \u29d7)
+## \u25b6 = play (replays)
 ##
 ## prefix for widgets names:
-## but, lab, ent, frm
+## but, lab, ent, frm, chk
+
+#masks of the mouse buttons held in an event's state
+BUTTON_1 = 0x100
+BUTTON_3 = 0x400
+
+#time a cascade may take before letting tkinter draw and handle events
+CASCADE_BUDGET_NS = 8000000
 
 class Screen:
     """
@@ -38,7 +54,7 @@ class Screen:
 class SetUpScreen(Screen):
     """
     Initial game screen. Sets the game's configuration (height of the grid,
-    width of the grid and number of mines).
+    width of the grid and number of mines), or loads a saved game.
     """
 
     def __init__(self, window):
@@ -53,9 +69,13 @@ class SetUpScreen(Screen):
 
         self.frames = [self.frm_options, self.frm_play]
 
-        self.height_option = SetUpOption(self.frm_options, "HEIGHT", 4, 20)
-        self.width_option = SetUpOption(self.frm_options, "WIDTH", 4, 20)
-        self.mines_option = SetUpOption(self.frm_options, "MINES", 2, 6)
+        #up to 10^6 x 10^6 squares, with up to 10^12 mines
+        self.height_option = SetUpOption(self.frm_options, "HEIGHT",
+                                         4, 1000000, digits=7)
+        self.width_option = SetUpOption(self.frm_options, "WIDTH",
+                                        4, 1000000, digits=7)
+        self.mines_option = SetUpOption(self.frm_options, "MINES", 2, 6,
+                                        digits=12)
 
         self.but_play = tk.Button(self.frm_play,
                                   text="PLAY", font=("Ubuntu Mono", 50, "bold"),
@@ -63,6 +83,21 @@ class SetUpScreen(Screen):
                                   highlightthickness=5,
                                   bg="#17c651", activebackground="#65c680")
 
+        self.no_guess = tk.BooleanVar(self.master, False)
+        self.chk_no_guess = tk.Checkbutton(self.frm_play,
+                                           text="NO GUESS",
+                                           font=("Ubuntu Mono", 30, "bold"),
+                                           variable=self.no_guess,
+                                           bg=self.master["bg"],
+                                           activebackground=self.master["bg"],
+                                           highlightthickness=0)
+
+        self.but_load = tk.Button(self.frm_play,
+                                  text="LOAD", font=("Ubuntu Mono", 30, "bold"),
+                                  highlightbackground="black",
+                                  highlightthickness=3,
+                                  bg="#6fa8dc", activebackground="#9fc5e8")
+
         for opt in [self.height_option, self.width_option]:
             for wid in [opt.ent, opt.but_minus, opt.but_plus]:
                 wid.bind("<FocusOut>", self.correctMinesLimits)
@@ -118,6 +153,10 @@ class SetUpScreen(Screen):
 
         self.but_play.grid(row=0, column=0,
                            pady=(100, 0))
+        self.chk_no_guess.grid(row=0, column=1,
+                               padx=(40, 0), pady=(100, 0))
+        self.but_load.grid(row=0, column=2,
+                           padx=(40, 0), pady=(100, 0))
 
     def correctMinesLimits(self, event):
         h = self.height_option
@@ -126,7 +165,10 @@ class SetUpScreen(Screen):
            and w.ent.get().isdigit() and h.mini <= int(w.ent.get()) <= w.maxi:
             h = int(h.ent.get())
             w = int(w.ent.get())
-            self.mines_option.setMini(round(max(2, h*w * 1/12)))
+            if h*w > LAZY_CELLS: #huge boards need more mines
+                self.mines_option.setMini(round(h*w * MIN_DENSITY))
+            else:
+                self.mines_option.setMini(round(max(2, h*w * 1/12)))
             self.mines_option.setMaxi(round(min(h*w - 10, h*w * 5/6)))
 
 
@@ -138,7 +180,7 @@ class SetUpOption:
     Created inside the first frame of the SetUpScreen.
     """
 
-    def __init__(self, master, name, mini, maxi):
+    def __init__(self, master, name, mini, maxi, digits=4):
         self.master = master
         self.name = name
         self.mini = mini
@@ -149,7 +191,7 @@ class SetUpOption:
                                  bg=master["bg"])
 
         self.ent = tk.Entry(self.master,
-                            width=3,
+                            width=digits,
                             highlightbackground="black",
                             highlightthickness=3,
                             font=("Ubuntu Mono", 45, "bold"))
@@ -288,6 +330,15 @@ class GameScreen(Screen):
                                        bg="#ffd966",
                                        highlightbackground="black",
                                        highlightthickness=2)
+        self.but_hint = tk.Button(self.frm_options,
+                                  width=10, height=1,
+                                  font=("Ubuntu Mono", 26, "bold"),
+                                  text="Hint",
+                                  bg="#6fa8dc", fg="black",
+                                  highlightbackground="black",
+                                  highlightthickness=2,
+                                  activebackground="#9fc5e8",
+                                  command=self.hint)
         self.but_cancel = tk.Button(self.frm_options,
                                     width=10, height=1,
                                     font=("Ubuntu Mono", 26, "bold"),
@@ -297,19 +348,66 @@ class GameScreen(Screen):
                                     highlightthickness=2,
                                     activebackground="#c67474")
 
+        #times of the moves, shown with F3 and saved with Control-E
+        self.perf = LatencyMonitor()
+        self.perf.subscribe(self.updatePerf)
+        self.lab_perf = tk.Label(self.frm_info,
+                                 font=("Ubuntu Mono", 11),
+                                 justify="left",
+                                 bg=self.master["bg"], fg="black")
+        self.show_perf = False
+
         self.frames = [self.frm_grid, self.frm_info]
 
+        #grids generated in the background for the first clicks
+        self.pool = BoardPool()
+
     def overAgain(self):
         self.destroy()
         self.setNewGame(self.grid.getHeight(), self.grid.getWidth(),
-                        self.grid.getNMines())
+                        self.grid.getNMines(), self.no_guess)
         self.show()
 
-    def setNewGame(self, height, width, n_mines):
-        self.grid = Grid(height, width, n_mines)
+    def setNewGame(self, height, width, n_mines, no_guess=False, grid=None,
+                   moves=()):
+        """
+        Sets a new game. grid is a grid loaded from a file (with its mines
+        placed and maybe some moves played); None starts a fresh one.
+        moves are the moves of a loaded game, replayed when it is shown.
+        Boards with more than LAZY_CELLS squares are played on a LazyGrid,
+        without hints nor no-guess grids.
+        """
+        self.lazy = grid is None and height*width > LAZY_CELLS
+        if self.lazy:
+            self.grid = LazyGrid(height, width, n_mines)
+        else:
+            self.grid = grid if grid is not None \
+                        else Grid(height, width, n_mines)
+        self.no_guess = no_guess #grid solvable without guessing
+        self.generation = None #statistics of the no-guess generation
+        self.updatePerf()
+        if not self.grid.hasMines() and not self.lazy:
+            self.pool.prefetch(height, width, n_mines, no_guess)
+        self.solver = Solver(self.grid) if not self.lazy else None
+        self.but_hint["state"] = "disabled" if self.lazy else "normal"
+        self.recorder = MoveRecorder(moves)
+        self.replayer = None
+        self.replay_moves = list(moves)
+        self.moves = deque() #moves waiting for the cascade to end
+        self.n_queued = 0 #moves queued so far
+        self.click_ns = None #perf start of the event being handled
+        #move being played: (kind, row, col, time of the click,
+        #perf start of the click or None, steps)
+        self.cascade = None
+        self.cascade_changed = False
+        self.id_cascade = None
+        self.order = None #grid ordered to the pool, being generated
+        self.id_order = None
         self.time_start = 0 #serve as a control variable too
+        self.started = False #True once the first click started the game
 
-        self.lab_n_flags["text"] = "0/{}".format(n_mines)
+        self.lab_n_flags["text"] = "{}/{}".format(
+            self.grid.getNFlaggedSquares(), n_mines)
         self.lab_time["text"] = "00:00"
         self.lab_match.config(fg="#f1c232", text="WAITING")
         self.but_overagain.config(bg="#ffd966",
@@ -321,34 +419,32 @@ class GameScreen(Screen):
         self.frm_grid.pack(side="left")
         self.frm_info.pack(side="right")
 
-        fsize = min(self.gsize_fsize[self.grid.getHeight()],
-                    + self.gsize_fsize[self.grid.getWidth()])
-        for r in range(self.grid.getHeight()):
-            for c in range(self.grid.getWidth()):
-                b = tk.Button(self.frm_grid,
-                              width=2, height=1,
-                              font=("Ubuntu Mono", fsize),
-                              fg="black", text=" ", activeforeground="black",
-                              bg="#6fa8dc", activebackground="#9fc5e8",
-                              highlightbackground="black",
-                              highlightthickness=2,
-                              state="normal")
-                padx = (0, 0)
-                pady = (0, 0)
-                if r == 0:
-                    pady = (20, 0)
-                elif r == self.grid.getHeight()-1:
-                    pady = (0, 20)
-                if c == 0:
-                    padx = (20+self.w_padyleft[self.grid.getWidth()],
-                            0)
-                elif c == self.grid.getWidth()-1:
-                    padx = (0, 20)
-                b.grid(row=r, column=c,
-                       padx=padx, pady=pady)
-                b.bind("<Button-1>", self.start)
-                b.bind("<Button-3>", self.flag)
-                self.grid.getSquare(r, c).setButton(b)
+        if self.grid.getHeight() in self.gsize_fsize \
+           and self.grid.getWidth() in self.gsize_fsize:
+            fsize = min(self.gsize_fsize[self.grid.getHeight()],
+                        + self.gsize_fsize[self.grid.getWidth()])
+            padleft = self.w_padyleft[self.grid.getWidth()]
+            self.renderer = ButtonRenderer(self.frm_grid, self.grid, fsize,
+                                           padleft)
+        else: #too big for a button per square
+            self.renderer = CanvasRenderer(self.frm_grid, self.grid,
+                                           int(self.master_w*0.8) - 40,
+                                           int(self.master_h) - 40)
+        self.renderer.on_flush = self.perf.rendered
+        self.renderer.bind("<Button-1>", self.timed(self.click))
+        self.renderer.bind("<Button-3>", self.timed(self.flag))
+        self.renderer.bind("<Button-2>", self.timed(self.chord))
+        self.master.bind("<Control-s>", self.saveGame)
+        self.master.bind("<F3>", self.togglePerf)
+        self.master.bind("<Control-e>", self.savePerf)
+        if self.replay_moves:
+            self.replay(self.replay_moves)
+        if self.grid.hasMines(): #loaded game, draws the moves played
+            width = self.grid.getWidth()
+            self.renderer.markDirty(
+                [divmod(i, width) for i, (s, f) in
+                 enumerate(zip(self.grid.getStates(), self.grid.getFlags()))
+                 if s or f])
         self.frm_flag.pack(pady=(0, 15))
         self.frm_clock.pack(pady=(15, 30))
         self.frm_match.pack(pady=(30, 30))
@@ -361,8 +457,12 @@ class GameScreen(Screen):
         self.lab_match.pack(padx=2, ipadx=4, ipady=5)
         self.but_overagain.pack(padx=4, pady=(0, 2),
                                 ipady=5)
+        self.but_hint.pack(padx=4, pady=(2, 2),
+                           ipady=5)
         self.but_cancel.pack(padx=4, pady=(2, 0),
                              ipady=5)
+        if self.show_perf:
+            self.lab_perf.pack(pady=(10, 0))
 
     def updateTime(self):
         time_now = int(monotonic())
@@ -374,24 +474,76 @@ class GameScreen(Screen):
         self.lab_time["text"] = m + ":" + s
         self.id_time = self.lab_time.after(995, self.updateTime)
 
+    def click(self, event):
+        """
+        Called when user clicks the mouse's left button: the first click
+        starts the game, the others play.
+        """
+        if self.started:
+            self.play(event)
+        else:
+            self.start(event)
+
     def start(self, event):
+        pos = self.renderer.getPosition(event)
+        if pos is None or self.replayer is not None:
+            return #outside the grid or replaying
+        if event.state & BUTTON_3:
+            return #both buttons, nothing to chord yet
+        self.perf.mark("hit-test")
         self.is_start = True
-
-        self.time_start = int(monotonic()) #start time
+        self.started = True
+
+        if self.lazy:
+            self.grid.setMines(*pos)
+        elif not self.grid.hasMines():
+            self.order = self.pool.order(
+                self.grid.getHeight(), self.grid.getWidth(),
+                self.grid.getNMines(), *pos, self.no_guess)
+
+        self.perf.mark("engine")
+        self.play(event) #queued until the mines are placed
+        if self.order is not None:
+            self.waitGrid()
+        else:
+            self.startClock()
+
+    def startClock(self):
+        moves = self.recorder.getMoves()
+        #start time, going on from the moves of a loaded game
+        self.time_start = int(monotonic()) - (moves[-1][3] // 1000
+                                              if moves else 0)
         self.updateTime()
 
         self.lab_match.config(fg="black", text="IN GAME")
         self.but_overagain.config(state="normal", fg="black",
                                   bg="#f1c232", activebackground="#ffd966")
-        row = event.widget.grid_info()["row"]
-        col = event.widget.grid_info()["column"]
-        self.grid.setMines(row, col)
 
-        for r in self.grid.getGrid():
-            for sq in r:
-                sq.getButton().bind("<Button-1>", self.play)
+    def waitGrid(self):
+        """
+        Polls the grid ordered to the pool at the first click. Until it
+        is ready, the moves are queued and the clock does not run; then
+        its mines are placed and the queued moves are played. Tells the
+        player if no no-guess grid could be made for the click.
+        """
+        self.id_order = None
+        if not self.order.done():
+            self.lab_match.config(fg="black", text="GENERATING")
+            self.id_order = self.master.after(50, self.waitGrid)
+            return
 
-        self.play(event)
+        order = self.order
+        self.order = None
+        self.grid.placeMines(order.mines)
+        self.generation = order.stats
+        self.updatePerf()
+        if order.fallback: #before the clock starts
+            messagebox.showwarning(
+                "No guess", "No grid solvable without guessing was found "
+                "for this click; this one may need guessing.",
+                parent=self.master)
+        self.startClock()
+        self.nextMove()
 
     def play(self, event):
         """
@@ -403,38 +555,107 @@ class GameScreen(Screen):
         this square. Check if, after the expansion, the player wins.
         """
 
-        row = event.widget.grid_info()["row"]
-        col = event.widget.grid_info()["column"]
+        pos = self.renderer.getPosition(event)
+        if pos is None or self.replayer is not None:
+            return #outside the grid or replaying
+        if event.state & BUTTON_3: #both buttons
+            self.chord(event)
+            return
+        self.perf.mark("hit-test")
+        row, col = pos
 
-        if self.grid.getSquare(row, col).getState() == 1 \
+        if self.grid.getSquare(row, col).getState() != 0 \
            or self.grid.getSquare(row, col).getFlag() == "\u2691" \
            and not self.is_start:
             return #nothing happens
 
-        if self.grid.getSquare(row, col).getValue() == "\u2620": #mine
-            self.lab_time.after_cancel(self.id_time)
+        self.queueMove("reveal", row, col)
+
+        if self.is_start:
+            self.is_start = False
+
+    def queueMove(self, kind, row, col):
+        """
+        Plays a move, or queues it if a cascade is still being revealed;
+        the queued moves are played in order once it is over. The move
+        is recorded with the time of the click, and timed from it.
+        """
+        self.moves.append((kind, row, col, monotonic_ns(), self.click_ns))
+        self.n_queued += 1
+        if self.cascade is None and self.order is None:
+            self.nextMove()
+
+    def nextMove(self):
+        if self.moves:
+            kind, row, col, now, click_ns = self.moves.popleft()
+            self.cascade = (kind, row, col, now, click_ns,
+                            self.grid.moveSteps(kind, row, col))
+            self.cascade_changed = False
+            self.stepCascade()
+
+    def stepCascade(self):
+        """
+        Plays the current move for up to CASCADE_BUDGET_NS, a few
+        hundred squares at a time. If it is not over, draws what was
+        revealed so far, handles the events (and the clock) and goes on
+        in the next frame; otherwise goes to the next queued move.
+        """
+        self.id_cascade = None
+        kind, row, col, now, click_ns, steps = self.cascade
+        deadline = perf_counter_ns() + CASCADE_BUDGET_NS
+        for changes in steps:
+            if changes:
+                self.cascade_changed = True
+            if perf_counter_ns() >= deadline:
+                self.id_cascade = self.master.after(1, self.stepCascade)
+                return
+
+        self.cascade = None
+        if self.cascade_changed:
+            self.recorder.record(kind, row, col, now)
+        if click_ns is not None:
+            self.perf.done(click_ns, self.renderer.isFlushPending())
+        self.checkEnd()
+        if self.grid.isLost() or self.hadVictory():
+            self.moves.clear() #the game is over
+        self.nextMove()
+
+    def stopCascade(self):
+        if self.id_cascade is not None:
+            self.master.after_cancel(self.id_cascade)
+            self.id_cascade = None
+        if self.id_order is not None:
+            self.master.after_cancel(self.id_order)
+            self.id_order = None
+        self.order = None
+        self.cascade = None
+        self.moves.clear()
+
+    def checkEnd(self):
+        """
+        Shows the end of the game if the last move lost or won it.
+        """
+        if self.grid.isLost(): #mine
+            if self.time_start != 0:
+                self.lab_time.after_cancel(self.id_time)
             self.lab_match.config(fg="#c63d3d", text="YOU LOSE")
-            self.but_overagain.config(bg="#17c651", activebackground="#65c680",
+            self.but_overagain.config(state="normal", fg="black",
+                                      bg="#17c651", activebackground="#65c680",
                                       text="Play again")
-            self.grid.showAll(lose=True)
-            self.grid.getSquare(row, col).getButton().config(
-                disabledforeground="red")
-            return
         else: #normal play
-            self.grid.expandPosition(row, col)
             self.updateNFlaggedSquares()
             if self.hadVictory(): #victory
-                self.lab_time.after_cancel(self.id_time)
+                if self.time_start != 0:
+                    self.lab_time.after_cancel(self.id_time)
                 self.time_start = 0
                 self.grid.showAll(win=True)
                 self.updateNFlaggedSquares()
                 self.lab_match.config(fg="#17c651", text="YOU WIN")
-                self.but_overagain.config(bg="#17c651", activebackground="#65c680",
+                self.but_overagain.config(state="normal", fg="black",
+                                          bg="#17c651",
+                                          activebackground="#65c680",
                                           text="Play again")
 
-        if self.is_start:
-            self.is_start = False
-
     def updateNFlaggedSquares(self):
         self.lab_n_flags["text"] = "{}/{}".format(
             self.grid.getNFlaggedSquares(), self.grid.getNMines())
@@ -450,39 +671,159 @@ class GameScreen(Screen):
         If square has a question mark, it has its flag removed.
         """
 
-        row = event.widget.grid_info()["row"]
-        col = event.widget.grid_info()["column"]
-        if self.grid.getSquare(row, col).getState() == 0:
-            f = self.grid.getNFlaggedSquares()
-            n = self.grid.getNMines()
+        pos = self.renderer.getPosition(event)
+        if pos is None or self.replayer is not None:
+            return #outside the grid or replaying
+        if event.state & BUTTON_1: #both buttons
+            self.chord(event)
+            return
+        self.perf.mark("hit-test")
+        self.queueMove("flag", *pos)
 
-            if self.grid.getSquare(row, col).getFlag() == "":
-                if f < n:
-                    self.grid.getSquare(row, col).setFlag("\u2691")
-                    self.grid.addFlaggedSquare()
-                else:
-                    self.grid.getSquare(row, col).setFlag("?")
+    def chord(self, event):
+        """
+        Called when player clicks the mouse's middle button, or both
+        buttons, on a revealed number.
+        If the number of flags around the number matches it, reveals
+        every unflagged square around it at once. If a flag is wrong,
+        the player loses.
+        """
+        pos = self.renderer.getPosition(event)
+        if pos is None or self.replayer is not None:
+            return #outside the grid or replaying
+        self.perf.mark("hit-test")
+        self.queueMove("chord", *pos)
 
-            elif self.grid.getSquare(row, col).getFlag() == "\u2691":
-                self.grid.getSquare(row, col).setFlag("?")
-                self.grid.removeFlaggedSquare()
+    def hint(self):
+        """
+        Called when player clicks the hint button.
+        Points out a square: green if it is safe, red if it is a mine
+        not flagged yet, and yellow if there is no sure square, the one
+        least likely to be a mine.
+        """
+        if self.solver is None or self.cascade is not None \
+           or self.order is not None:
+            return #no hints on huge boards, nor during a move
+        hint = self.solver.hint()
+        if hint is not None and self.replayer is None:
+            row, col, kind, p = hint
+            colors = {"safe": "#65c680", "mine": "#c67474",
+                      "guess": "#ffd966", "estimate": "#ffd966"}
+            self.renderer.highlight(row, col, colors[kind])
+
+    def saveGame(self, event=None):
+        """
+        Called with Control-S. Saves the grid in a board file, once its
+        mines are placed.
+        """
+        if not self.grid.hasMines() or self.lazy or self.cascade is not None:
+            return #nothing to save yet, too big or in the middle of a move
+        path = filedialog.asksaveasfilename(
+            parent=self.master, defaultextension=".msw",
+            filetypes=[("Minesweeper games", "*.msw")])
+        if path:
+            self.grid.save(path, self.recorder.getMoves())
+
+    def replay(self, moves):
+        """
+        Replays the moves of a loaded game at the time they were played.
+        The keys + and - make the replay faster or slower (1x to 100x);
+        once it is over, the player goes on from where it stopped.
+        """
+        self.replayer = Replayer(self.master, self.grid, moves,
+                                 on_move=self.replayed, on_end=self.replayEnded)
+        self.master.bind("<plus>", lambda e: self.setReplaySpeed(2))
+        self.master.bind("<minus>", lambda e: self.setReplaySpeed(0.5))
+        self.setReplaySpeed(1)
+        self.replayer.start()
+
+    def setReplaySpeed(self, factor):
+        speed = round(self.replayer.getSpeed() * factor)
+        self.replayer.setSpeed(speed)
+        self.lab_match.config(fg="black",
+                              text="\u25b6 x{}".format(self.replayer.getSpeed()))
+
+    def replayed(self, kind, row, col):
+        self.updateNFlaggedSquares()
+
+    def replayEnded(self):
+        self.stopReplay()
+        self.lab_match.config(fg="#f1c232", text="WAITING")
+        self.checkEnd()
+        if self.grid.isLost() or self.hadVictory():
+            #the game is over, clicks must not start it
+            self.is_start = False
+            self.started = True
 
-            elif self.grid.getSquare(row, col).getFlag() == "?":
-                self.grid.getSquare(row, col).setFlag("")
+    def stopReplay(self):
+        if self.replayer is not None:
+            self.replayer.stop()
+            self.replayer = None
+            self.master.unbind("<plus>")
+            self.master.unbind("<minus>")
 
-            self.updateNFlaggedSquares()
+    def timed(self, handler):
+        """
+        Returns the event's handler with the move's time measured.
+        The handler marks the end of its hit-test; the rest of it is
+        counted as the engine's time. Clicks that queue no move are not
+        timed. The move queued keeps the click's start, for its total.
+        """
+        def timedHandler(event):
+            self.click_ns = self.perf.begin()
+            n_queued = self.n_queued
+            handler(event)
+            self.click_ns = None
+            if self.n_queued != n_queued:
+                self.perf.finish()
+            else:
+                self.perf.cancel() #ignored click
+        return timedHandler
+
+    def togglePerf(self, event=None):
+        """
+        Called with F3. Shows or hides the moves' times (p50, p95 and
+        p99 of every phase, in milliseconds), and how the no-guess grid
+        was generated.
+        """
+        self.show_perf = not self.show_perf
+        if self.show_perf:
+            self.updatePerf()
+            self.lab_perf.pack(pady=(10, 0))
+        else:
+            self.lab_perf.pack_forget()
+
+    def updatePerf(self):
+        if self.show_perf:
+            text = self.perf.getText()
+            if self.generation is not None:
+                text += "\ngrid {:.0f} ms, {} tries, {} fixes".format(
+                    self.generation["time"] * 1000,
+                    self.generation["attempts"], self.generation["repairs"])
+            self.lab_perf["text"] = text
+
+    def savePerf(self, event=None):
+        """
+        Called with Control-E. Saves the moves' times in a JSON file.
+        """
+        path = filedialog.asksaveasfilename(
+            parent=self.master, defaultextension=".json",
+            filetypes=[("JSON", "*.json")])
+        if path:
+            self.perf.save(path)
 
     def hadVictory(self):
-        for r in self.grid.getGrid():
-            for sq in r:
-                if sq.getState() == 0 and sq.getValue() == " ":
-                    return False
-        return True
+        return self.grid.hadVictory()
 
     def destroy(self):
         if self.time_start != 0: #game started
             self.lab_time.after_cancel(self.id_time)
-        for r in self.grid.getGrid():
-            for sq in r:
-                sq.getButton().grid_forget()
+        self.master.unbind("<Control-s>")
+        self.master.unbind("<F3>")
+        self.master.unbind("<Control-e>")
+        self.stopReplay()
+        self.stopCascade()
+        self.renderer.destroy()
+        if self.lazy:
+            self.grid.close() #its spill file and map
         super().destroy()
@@ -0,0 +1,198 @@
+import argparse
+import csv
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+from random import Random
+from time import perf_counter_ns
+from game import Grid
+from solver import Solver
+
+"""
+Command line tool that plays many games without the GUI, spread over
+several processes, to measure win rates and the cost of each move.
+Usage example:
+    python simulate.py --board 16x30x99 --games 10000 --strategy solver
+"""
+
+class RandomStrategy:
+    """
+    Strategy that reveals a random hidden square every move.
+    A strategy is created for each game with the grid and a random.Random,
+    and its method move returns the next move: ("reveal", row, col) or
+    ("flag", row, col).
+    """
+
+    def __init__(self, grid, rng):
+        self.grid = grid
+        self.rng = rng
+
+    def move(self):
+        states = self.grid.getStates()
+        while True:
+            i = self.rng.randrange(len(states))
+            if states[i] == 0:
+                return ("reveal",) + divmod(i, self.grid.getWidth())
+
+
+class SolverStrategy:
+    """
+    Strategy that follows the solver's hints: starts at the center,
+    reveals the safe squares, flags the mines and, when nothing is
+    sure, reveals the square least likely to be a mine.
+    """
+
+    def __init__(self, grid, rng):
+        self.grid = grid
+        self.solver = Solver(grid)
+
+    def move(self):
+        hint = self.solver.hint()
+        if hint is None: #first click
+            return ("reveal", self.grid.getHeight() // 2,
+                    self.grid.getWidth() // 2)
+        row, col, kind, p = hint
+        if kind == "mine":
+            return ("flag", row, col)
+        return ("reveal", row, col)
+
+
+STRATEGIES = {"random": RandomStrategy, "solver": SolverStrategy}
+
+def getStrategy(name):
+    """
+    Returns a strategy class from its name in STRATEGIES or from a
+    "module:Class" path, for strategies outside this module.
+    """
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    module, cls = name.split(":")
+    return getattr(import_module(module), cls)
+
+
+def playGame(height, width, n_mines, strategy, seed):
+    """
+    Plays a game until it is won or lost.
+    Returns (won, moves, progress, nanoseconds spent in the grid's moves).
+    """
+    rng = Random(seed)
+    grid = Grid(height, width, n_mines)
+    player = strategy(grid, rng)
+    moves = 0
+    spent = 0
+    started = False
+    while not grid.isLost() and not grid.hadVictory():
+        kind, row, col = player.move()
+        start = perf_counter_ns()
+        if kind == "flag":
+            grid.toggleFlag(row, col)
+        else:
+            if not started:
+                grid.setMines(row, col, rng)
+                started = True
+            grid.reveal(row, col)
+        spent += perf_counter_ns() - start
+        moves += 1
+    return grid.hadVictory(), moves, grid.getProgress(), spent
+
+
+def playChunk(height, width, n_mines, strategy_name, seed, first, n_games):
+    """
+    Plays the games first to first + n_games - 1 of a board, each one
+    with its own seed built from the run's seed and the game's number,
+    so the results do not depend on which process plays them.
+    Returns the sums of the games' results.
+    """
+    strategy = getStrategy(strategy_name)
+    total = {"games": 0, "wins": 0, "moves": 0, "progress": 0.0,
+             "move_ns": 0, "cpu_ns": 0}
+    for k in range(first, first + n_games):
+        start = perf_counter_ns()
+        won, moves, progress, spent = playGame(
+            height, width, n_mines, strategy,
+            "{}-{}x{}x{}-{}".format(seed, height, width, n_mines, k))
+        total["games"] += 1
+        total["wins"] += won
+        total["moves"] += moves
+        total["progress"] += progress
+        total["move_ns"] += spent
+        total["cpu_ns"] += perf_counter_ns() - start
+    return total
+
+
+def summarize(board, strategy_name, total):
+    height, width, n_mines = board
+    return {"height": height, "width": width, "mines": n_mines,
+            "strategy": strategy_name,
+            "games": total["games"],
+            "wins": total["wins"],
+            "win_rate": total["wins"] / total["games"],
+            "mean_moves": total["moves"] / total["games"],
+            "mean_progress": total["progress"] / total["games"],
+            "move_us": total["move_ns"] / max(1, total["moves"]) / 1000,
+            "game_ms": total["cpu_ns"] / total["games"] / 1e6}
+
+
+def parseBoard(text):
+    height, width, n_mines = (int(v) for v in text.lower().split("x"))
+    return height, width, n_mines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Plays games without the GUI to measure win rates "
+                    "and the cost of each move.")
+    parser.add_argument("--board", type=parseBoard, action="append",
+                        help="HEIGHTxWIDTHxMINES, may be repeated "
+                             "(default: 9x9x10, 16x16x40 and 16x30x99)")
+    parser.add_argument("--games", type=int, default=1000,
+                        help="games per board")
+    parser.add_argument("--strategy", default="solver",
+                        help="random, solver or module:Class")
+    parser.add_argument("--seed", default="0")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes (default: one per CPU)")
+    parser.add_argument("--chunk", type=int, default=50,
+                        help="games sent to a process at a time")
+    parser.add_argument("--format", choices=["json", "csv"], default="json")
+    parser.add_argument("--output", type=argparse.FileType("w"),
+                        default=sys.stdout)
+    args = parser.parse_args(argv)
+    boards = args.board or [(9, 9, 10), (16, 16, 40), (16, 30, 99)]
+    getStrategy(args.strategy) #fails early for unknown strategies
+
+    jobs = [] #(board, first game, number of games)
+    for board in boards:
+        for first in range(0, args.games, args.chunk):
+            jobs.append((board, first, min(args.chunk, args.games - first)))
+
+    writer = None
+    with ProcessPoolExecutor(args.workers) as executor:
+        results = executor.map(playChunk,
+                               *zip(*[board + (args.strategy, args.seed,
+                                               first, n)
+                                      for board, first, n in jobs]))
+        total = None
+        for (board, first, n), chunk in zip(jobs, results):
+            if total is None:
+                total = dict.fromkeys(chunk, 0)
+            for key in chunk:
+                total[key] += chunk[key]
+            if first + n < args.games:
+                continue
+            #last chunk of the board: its results are complete
+            row = summarize(board, args.strategy, total)
+            total = None
+            if args.format == "json":
+                args.output.write(json.dumps(row) + "\n")
+            else:
+                if writer is None:
+                    writer = csv.DictWriter(args.output, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+            args.output.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,481 @@
+from collections import deque
+from math import lgamma, exp, inf
+from matrix_expansion import neighborTable
+
+"""
+Module that solves the game's grid from what a player can see: the
+revealed numbers and the total number of mines.
+"""
+
+class Solver:
+    """
+    Class that deduces safe squares and mines of a Grid.
+    Every revealed number is a constraint: its hidden neighbors, not yet
+    deduced, hold a known number of mines. The solver subscribes to the
+    grid and only re-examines the constraints around the squares changed
+    by each move, with two rules:
+    - single constraint: no mines left means every square is safe, as
+      many mines as squares means every square is a mine;
+    - pairs of overlapping constraints: if the mines one has beyond the
+      other fill the squares only it has, those squares are mines and
+      the squares only the other has are safe (this covers subsets).
+    When that is not enough, exact enumerates every valid layout of each
+    connected group of constraints (the frontier components), giving
+    deductions and the probability of a mine in every hidden square.
+    Components are cached by their constraints, so the ones a move did
+    not touch are not enumerated again.
+    Squares are flat indexes (row*width + col), as in the grid's planes.
+    """
+
+    #components needing more states than this to be counted (see
+    #_enumerate) are estimated, and so are the probabilities they touch
+    MAX_STATES = 200000
+    MAX_EXACT = 500 #squares of a component (the counting is recursive)
+
+    def __init__(self, grid):
+        self.grid = grid
+        self._width = grid.getWidth()
+        n = grid.getHeight()*grid.getWidth()
+        self._kinds, self._offsets = neighborTable(grid.getHeight(),
+                                                   self._width)
+
+        self._known = bytearray(n) #0 (unknown), 1 (safe), 2 (mine)
+        self._safe = set() #deduced safe squares still hidden
+        self._known_mines = set()
+        self._constraints = {} #number's index: (unknown squares, mines)
+        self._queue = deque()
+        self._queued = set()
+        self._exact_cache = {}
+        self.estimated = False #the last probabilities were estimated
+
+        grid.subscribe(self.update)
+        self.update([divmod(i, self._width) for i in range(n)
+                     if grid.getStates()[i] == 1])
+
+    def update(self, changes):
+        """
+        Listener of the grid. Queues the constraints around the squares
+        revealed and propagates the rules.
+        """
+        if self.grid.isLost() or self.grid.hadVictory():
+            return
+        states = self.grid.getStates()
+        for row, col in changes:
+            i = row*self._width + col
+            if states[i] == 1:
+                self._safe.discard(i)
+                self._touch(i)
+        self._propagate()
+
+    def _touch(self, i):
+        """
+        Queues the constraints of i and of the numbers around it.
+        """
+        states = self.grid.getStates()
+        counts = self.grid.getCounts()
+        for j in (i,) + tuple(i + d for d in self._offsets[self._kinds[i]]):
+            if states[j] == 1 and counts[j] and j not in self._queued:
+                self._queued.add(j)
+                self._queue.append(j)
+
+    def _constraint(self, i):
+        """
+        Returns the unknown hidden squares around the number at i and
+        how many mines they hold.
+        """
+        states = self.grid.getStates()
+        known = self._known
+        unknown = []
+        n_mines = self.grid.getCounts()[i]
+        for d in self._offsets[self._kinds[i]]:
+            j = i + d
+            if states[j] == 0:
+                if known[j] == 2:
+                    n_mines -= 1
+                elif known[j] == 0:
+                    unknown.append(j)
+        return unknown, n_mines
+
+    def _mark(self, squares, value):
+        """
+        Marks squares as safe (value 1) or mines (value 2).
+        Returns whether anything new was learned.
+        """
+        new = False
+        for j in squares:
+            if self._known[j] == 0:
+                new = True
+                self._known[j] = value
+                if value == 1:
+                    self._safe.add(j)
+                else:
+                    self._known_mines.add(j)
+                self._touch(j)
+        return new
+
+    def _overlapping(self, i, unknown):
+        """
+        Returns the numbers, other than i, around the given squares.
+        """
+        states = self.grid.getStates()
+        counts = self.grid.getCounts()
+        others = set()
+        for u in unknown:
+            for d in self._offsets[self._kinds[u]]:
+                j = u + d
+                if j != i and states[j] == 1 and counts[j]:
+                    others.add(j)
+        return others
+
+    def _propagate(self):
+        while self._queue:
+            i = self._queue.popleft()
+            self._queued.discard(i)
+            unknown, n_mines = self._constraint(i)
+            if not unknown:
+                self._constraints.pop(i, None)
+                continue
+            if n_mines == 0:
+                self._mark(unknown, 1)
+                continue
+            if n_mines == len(unknown):
+                self._mark(unknown, 2)
+                continue
+            self._constraints[i] = (unknown, n_mines)
+
+            a = set(unknown)
+            for j in self._overlapping(i, unknown):
+                other, other_mines = self._constraint(j)
+                b = set(other)
+                only_a = a - b
+                only_b = b - a
+                if other_mines - n_mines == len(only_b):
+                    if self._mark(only_b, 2) | self._mark(only_a, 1):
+                        break
+                if n_mines - other_mines == len(only_a):
+                    if self._mark(only_a, 2) | self._mark(only_b, 1):
+                        break
+
+    def _components(self):
+        """
+        Splits the constraints in groups sharing unknown squares.
+        Returns a list of (squares, constraints) per group.
+        """
+        parent = {}
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for unknown, n_mines in self._constraints.values():
+            for u in unknown:
+                parent.setdefault(u, u)
+            root = find(unknown[0])
+            for u in unknown[1:]:
+                other = find(u)
+                if other != root:
+                    parent[other] = root
+
+        groups = {}
+        for i, (unknown, n_mines) in self._constraints.items():
+            group = groups.setdefault(find(unknown[0]), (set(), []))
+            group[0].update(unknown)
+            group[1].append((i, tuple(unknown), n_mines))
+        return [(squares, sorted(cons)) for squares, cons in groups.values()]
+
+    def _enumerate(self, squares, constraints):
+        """
+        Counts every layout of mines in the squares that agrees with the
+        constraints. Returns the squares in the order used and a dict:
+        number of mines -> [number of layouts, list with how many of them
+        have a mine in each square].
+        The squares are assigned in order, and what is left to assign
+        from the k-th square only depends on the mines placed so far in
+        the constraints still open (with squares before and after it),
+        so the counts of the rest are memoised by them: the frontier is
+        roughly a line, so few constraints are open at once and big
+        components cost about as much as many small ones.
+        Returns None if more than MAX_STATES states are needed.
+        """
+        #squares ordered so that constraints close early
+        cons_of = {}
+        for c, (i, unknown, n_mines) in enumerate(constraints):
+            for u in unknown:
+                cons_of.setdefault(u, []).append(c)
+        order = []
+        seen = set()
+        for i, unknown, n_mines in constraints:
+            for u in unknown:
+                if u not in seen:
+                    seen.add(u)
+                    order.append(u)
+        n = len(order)
+
+        square_cons = [cons_of[u] for u in order]
+        needed = [n_mines for i, unknown, n_mines in constraints]
+        left = [len(unknown) for i, unknown, n_mines in constraints]
+        placed = [0] * len(constraints)
+
+        #constraints open at the k-th square
+        first = {}
+        last = {}
+        for k, cons in enumerate(square_cons):
+            for c in cons:
+                first.setdefault(c, k)
+                last[c] = k
+        open_at = [[] for k in range(n)]
+        for c in first:
+            for k in range(first[c] + 1, last[c] + 1):
+                open_at[k].append(c)
+
+        memo = {}
+
+        def count(k):
+            """
+            Returns the layouts of the squares from k on, as a dict:
+            mines -> [layouts, mines in each of those squares].
+            """
+            if k == n:
+                return {0: [1, []]}
+            key = (k,) + tuple(placed[c] for c in open_at[k])
+            if key in memo:
+                return memo[key]
+            if len(memo) >= self.MAX_STATES:
+                raise OverflowError
+
+            results = {}
+            for value in (0, 1):
+                for c in square_cons[k]:
+                    m = placed[c] + value
+                    if m > needed[c] or m + left[c] - 1 < needed[c]:
+                        break
+                else:
+                    for c in square_cons[k]:
+                        placed[c] += value
+                        left[c] -= 1
+                    for m, (layouts, counts) in count(k + 1).items():
+                        result = results.setdefault(m + value,
+                                                    [0, [0] * (n - k)])
+                        result[0] += layouts
+                        result[1][0] += layouts * value
+                        total = result[1]
+                        for s, x in enumerate(counts, 1):
+                            total[s] += x
+                    for c in square_cons[k]:
+                        placed[c] -= value
+                        left[c] += 1
+            memo[key] = results
+            return results
+
+        try:
+            return order, count(0)
+        except OverflowError:
+            return None
+
+    def exact(self):
+        """
+        Enumerates the frontier components and combines them with the
+        squares away from any number, weighting each layout by the ways
+        the remaining mines fit in those squares.
+        Marks every square found to be always safe or always a mine and
+        returns (probabilities, other): the probability of a mine for
+        every frontier square and for any other unknown square.
+        """
+        self._propagate()
+        states = self.grid.getStates()
+        n_left = self.grid.getNMines() - len(self._known_mines)
+        n_hidden = states.count(0) - len(self._known_mines) - len(self._safe)
+
+        exact = [] #(squares in order, results)
+        estimates = {}
+        cache = {}
+        for squares, constraints in self._components():
+            key = tuple(constraints)
+            if key in self._exact_cache:
+                cache[key] = self._exact_cache[key]
+            elif len(squares) <= self.MAX_EXACT:
+                cache[key] = self._enumerate(squares, constraints)
+            else:
+                cache[key] = None
+            if cache[key] is not None:
+                exact.append(cache[key])
+                continue
+            for i, unknown, n_mines in constraints:
+                for u in unknown:
+                    estimates[u] = max(estimates.get(u, 0),
+                                       n_mines / len(unknown))
+        self._exact_cache = cache
+        self.estimated = bool(estimates)
+
+        #the estimated squares are left out of the others, with about
+        #the mines they hold
+        n_other = n_hidden - sum(len(order) for order, results in exact) \
+                  - len(estimates)
+        n_left = max(0, n_left - round(sum(estimates.values())))
+
+        def logWays(m):
+            k = n_left - m
+            if k < 0 or k > n_other:
+                return -inf
+            return lgamma(n_other + 1) - lgamma(k + 1) - lgamma(n_other - k + 1)
+
+        def combine(dists):
+            total = {0: 1}
+            for results in dists:
+                new = {}
+                for m, n in total.items():
+                    for m2, (n2, counts) in results.items():
+                        new[m + m2] = new.get(m + m2, 0) + n*n2
+                total = new
+            return total
+
+        total = combine([results for order, results in exact])
+        logs = {m: logWays(m) for m in total}
+        top = max(logs.values(), default=-inf)
+        if top == -inf: #no layout fits, nothing can be said
+            return {}, 0.0
+        weight = {m: n * exp(logs[m] - top) for m, n in total.items()}
+        all_weight = sum(weight.values())
+
+        probabilities = {}
+        safe = []
+        mines = []
+        for k, (order, results) in enumerate(exact):
+            rest = combine([r for o, r in exact[:k] + exact[k+1:]])
+            mines_weight = [0.0] * len(order)
+            always_safe = [True] * len(order)
+            always_mine = [True] * len(order)
+            for m, (n, counts) in results.items():
+                if all(logWays(m + m2) == -inf for m2 in rest) \
+                   and not self.estimated:
+                    continue #too many or too few mines left
+                w = sum(n2 * exp(logWays(m + m2) - top)
+                        for m2, n2 in rest.items())
+                for s in range(len(order)):
+                    mines_weight[s] += counts[s] * w
+                    if counts[s] != 0:
+                        always_safe[s] = False
+                    if counts[s] != n:
+                        always_mine[s] = False
+            for s, u in enumerate(order):
+                probabilities[u] = mines_weight[s] / all_weight
+                if always_safe[s]:
+                    safe.append(u)
+                elif always_mine[s]:
+                    mines.append(u)
+
+        other = 0.0
+        if n_other > 0:
+            other = sum(w * (n_left - m) / n_other
+                        for m, w in weight.items()) / all_weight
+            #the mines left may fix every other square at once
+            left = set(n_left - m for m in total if logs[m] > -inf)
+            if (left == {0} or left == {n_other}) and not self.estimated:
+                enumerated = set(u for order, results in exact for u in order)
+                i = states.find(0)
+                while i != -1:
+                    if self._known[i] == 0 and i not in enumerated:
+                        (safe if left == {0} else mines).append(i)
+                    i = states.find(0, i + 1)
+        probabilities.update(estimates)
+
+        self._mark(safe, 1)
+        self._mark(mines, 2)
+        self._propagate()
+        return probabilities, other
+
+    def getFrontier(self):
+        """
+        Returns the positions of the unknown squares next to a number.
+        """
+        self._propagate()
+        frontier = set(u for unknown, n_mines in self._constraints.values()
+                       for u in unknown)
+        return [divmod(u, self._width) for u in sorted(frontier)]
+
+    def getSafe(self):
+        """
+        Returns the positions of the squares known to be safe.
+        """
+        return [divmod(i, self._width) for i in self._safe]
+
+    def getMines(self):
+        """
+        Returns the positions of the squares known to be mines.
+        """
+        return [divmod(i, self._width) for i in self._known_mines]
+
+    def getProbabilities(self):
+        """
+        Returns the probability of a mine for every unknown square next
+        to a number, as a dict {(row, col): probability}, and the
+        probability for any other unknown square.
+        """
+        probabilities, other = self.exact()
+        return ({divmod(i, self._width): p for i, p in probabilities.items()},
+                other)
+
+    def hint(self):
+        """
+        Returns a hint as (row, col, kind, probability of a mine), where
+        kind is "safe", "mine" (a deduced mine not flagged yet),
+        "guess" (the square least likely to be a mine) or "estimate"
+        (the same, but some component was too big to be counted, so the
+        probabilities are estimated; see MAX_STATES).
+        Returns None when nothing is revealed yet or the game is over.
+        """
+        states = self.grid.getStates()
+        if self.grid.isLost() or self.grid.hadVictory() \
+           or states.count(0) == len(states):
+            return None
+
+        self._propagate()
+        if not self._safe:
+            probabilities, other = self.exact()
+        if self._safe:
+            return divmod(min(self._safe), self._width) + ("safe", 0.0)
+
+        flags = self.grid.getFlags()
+        for i in sorted(self._known_mines):
+            if flags[i] != 1:
+                return divmod(i, self._width) + ("mine", 1.0)
+
+        best, best_p = None, 2.0
+        for i, p in probabilities.items():
+            if p < best_p:
+                best, best_p = i, p
+        if other < best_p:
+            #any square away from the numbers will do
+            i = states.find(0)
+            while i != -1:
+                if self._known[i] == 0 and i not in probabilities:
+                    best, best_p = i, other
+                    break
+                i = states.find(0, i + 1)
+        if best is None:
+            return None
+        kind = "estimate" if self.estimated else "guess"
+        return divmod(best, self._width) + (kind, best_p)
+
+
+def solveFrom(grid, row, col, solver=None):
+    """
+    Plays a grid from its first click using only the solver's
+    deductions, never guessing.
+    Returns whether the grid was won.
+    """
+    if solver is None:
+        solver = Solver(grid)
+    grid.reveal(row, col)
+    while not grid.isLost() and not grid.hadVictory():
+        safe = solver.getSafe()
+        if not safe:
+            solver.exact()
+            safe = solver.getSafe()
+            if not safe:
+                return False #a guess would be needed
+        for r, c in safe:
+            grid.reveal(r, c)
+    return grid.hadVictory()